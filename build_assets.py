@@ -0,0 +1,238 @@
+"""
+Genera en el build la hoja de estilos de la app con las imágenes embebidas.
+
+Las marcas de agua y el logo van como data URIs en base64 dentro del CSS; el
+fondo pesa ~800 KB, así que armar ese bloque en cada rerun es costoso. Este
+script lo genera una sola vez en `assets/estilos.json` y la app lo lee al
+arrancar (si el archivo no existe o está desactualizado, la app lo arma una
+vez por proceso con la misma función). El paquete guarda el hash de este archivo:
+si se edita la plantilla CSS, el paquete generado deja de usarse.
+
+Uso:
+    python build_assets.py
+"""
+import base64
+import hashlib
+import json
+import os
+
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets")
+STYLE_BUNDLE_PATH = os.path.join(ASSETS_DIR, "estilos.json")
+STYLE_SOURCES = ("logo ressas 572x197.jpg", "Icono ressas.jpg", "Text RESsas.jpg")
+
+
+def get_base64_of_bin_file(bin_file):
+    with open(bin_file, 'rb') as f:
+        data = f.read()
+    return base64.b64encode(data).decode()
+
+def get_plotly_uri(path):
+    #Convierte una ruta de archivo en un Data URI para Plotly.
+    if os.path.exists(path):
+        encoded = get_base64_of_bin_file(path)
+        return f"data:image/jpg;base64,{encoded}"
+    return None
+
+
+def build_style_bundle(assets_dir: str = ASSETS_DIR) -> dict:
+    # Cargar imagen de fondo del proyecto 
+    #Marcas de Agua para los Graficos en modo fullscreen
+    logo_path = os.path.join(assets_dir, "logo ressas 572x197.jpg")  
+    logotxt_path = os.path.join(assets_dir, "Icono ressas.jpg")
+    watermark_path = os.path.join(assets_dir, "Text RESsas.jpg")
+    
+    bin_str_logo = ""
+    bin_str_bg = ""
+    bin_str_watermark = ""
+    # 2. Convertir imagen a base64
+    if os.path.exists(logo_path):
+        bin_str_logo = get_base64_of_bin_file(logo_path)
+    if os.path.exists(logotxt_path):
+        bin_str_bg = get_base64_of_bin_file(logotxt_path)
+    
+    if os.path.exists(watermark_path):
+        bin_str_watermark = get_base64_of_bin_file(watermark_path)  
+
+    uri_fondo = get_plotly_uri(logotxt_path)
+    uri_marca_agua = get_plotly_uri(watermark_path)
+
+
+    css = f"""
+        <style>
+        /* 1. Capa de fondo ajustada al contenido principal */
+            .stApp::before {{
+                content: "";
+                background-image: url("data:image/jpg;base64,{bin_str_bg}");
+                background-repeat: no-repeat;
+                background-attachment: fixed;
+                background-position: center; /* Centra la imagen dentro de su contenedor */
+                background-size: 40%; /* Tamaño de la marca de agua */
+                
+                position: fixed;
+                top: 0;
+                /* El truco: dejar que el flexbox de Streamlit maneje el margen izquierdo */
+                left: 0; 
+                right: 0;
+                bottom: 0;
+                
+                /* Margen para compensar el sidebar de Streamlit (aprox 21rem o 336px) */
+                margin-left: auto; 
+                margin-right: auto;
+                
+                opacity: 0.08;
+                z-index: -1;
+                pointer-events: none; /* Evita que el fondo interfiera con clicks */
+            }}
+         /* CAPA 2: Logo Inferior Derecha (Usando ::after) */
+            .stApp::after {{
+                content: "";
+                background-image: url("data:image/jpg;base64,{bin_str_logo}");
+                background-repeat: no-repeat;
+                background-position: bottom right;
+                background-size: 200px; /* Ajusta el tamaño deseado */
+                
+                position: fixed;
+                bottom: 20px; /* Margen desde abajo */
+                right: 20px;  /* Margen desde la derecha */
+                width: 200px; /* Debe ser igual o mayor a background-size */
+                height: 100px;
+                
+                opacity: 0.4; /* Un poco más visible que el fondo */
+                z-index: 1;   /* Por encima del fondo central */
+                pointer-events: none;
+            }}
+            
+            /* Ajuste para que el fondo ignore el sidebar visualmente */
+            @media (min-width: 992px) {{
+                .stApp::before {{ margin-left: 336px; }}
+            }}   
+            /* 2. LOGO SOLO EN LOS GRAFICOS*/
+
+            [data-testid="stFullScreenFrame"]::after {{
+                content: "";
+                background-image: url("data:image/jpg;base64,{bin_str_watermark}");
+                background-repeat: no-repeat;
+                background-position: center;
+                background-size: contain;
+                
+                /* Posicionamiento centrado */
+                position: absolute;
+                top: 50%;
+                left: 50%;
+                transform: translate(-50%, -50%);
+                
+                /* Tamaño y Opacidad */
+                width: 50%; 
+                height: 50%;
+                opacity: 0.10; /* Sutil para no estorbar la lectura */
+                
+                z-index: 99; /* Suficiente para estar sobre el gráfico pero bajo los tooltips */
+                pointer-events: none;
+            }}
+
+            /* 2. Aseguramos que el contenedor principal sea transparente */
+            .stApp {{
+                background-color: rgba(0,0,0,0);
+            }}
+        /* Ocultar elementos default
+        
+        header {{visibility: hidden;}} 
+        #MainMenu {{visibility: hidden;}}
+        footer {{visibility: hidden;}}*/
+       
+        
+        /* --- ESTILO PARA MÉTRICAS NORMALES --- */
+        [data-testid="stMetric"] {{
+            background-color: rgba(0,0,0,0); /* Mantener fondo blanco para legibilidad */
+            padding: 15px;
+            border-radius: 10px;
+            border: 1px solid #e2e8f0;
+            box-shadow: 0 2px 5px rgba(0,0,0,0.05);
+        }}
+        
+
+        /* --- AJUSTE PARA LOS INPUTS DEL SIDEBAR --- */
+         /* --- ALINEACIÓN HORIZONTAL EN SIDEBAR --- */
+            /* Forzamos al contenedor del widget a ser una fila */
+            [data-testid="stSidebar"] .stNumberInput {{
+                display: flex;
+                flex-direction: row;
+                align-items: center;
+                justify-content: space-between;
+                gap: 10px;
+                margin-bottom: 10px;
+            }}
+
+            /* Ajustamos el label (texto) para que no ocupe todo el ancho */
+            [data-testid="stSidebar"] .stNumberInput label {{
+                display: flex;
+                margin-bottom: 0 !important; /* Quita el espacio de abajo del texto */
+                flex: 1 1 auto;
+                min-width: 150px; /* Asegura espacio para el nombre */
+            }}
+
+            /* Ajustamos el cuadro de entrada de número */
+            [data-testid="stSidebar"] .stNumberInput div[data-baseweb="input"] {{
+                width: 120px !important; /* Ancho fijo para los cuadritos de números */
+                flex: 0 0 auto;
+            }}
+
+            /* Opcional: Hacer la fuente un poco más pequeña para que quepa mejor */
+            [data-testid="stSidebar"] label p {{
+                font-size: 14px !important;
+            }}  
+        /* --- AJUSTE PARA LOS INPUTS DEL SIDEBAR --- */
+            /* --- MOVER LOGO AL FINAL DEL SIDEBAR --- */
+        /* Convertimos el contenedor de widgets del sidebar en un Flexbox vertical */
+        [data-testid="stSidebarUserContent"] {{
+            display: flex;
+            flex-direction: column;
+            height: 90vh; /* Ajusta la altura para que ocupe casi toda la pantalla */
+        }} 
+
+        /* Buscamos el contenedor de la imagen y le damos un margen superior automático */
+        /* Esto empuja la imagen hacia el fondo del contenedor flex */
+        [data-testid="stSidebarUserContent"] .stImage {{
+            margin-top: auto !important;
+            padding-bottom: 20px;
+        }} 
+
+        </style>
+        
+    """
+    return {"css": css, "uri_marca_agua": uri_marca_agua, "uri_fondo": uri_fondo, "version": template_hash()}
+
+
+def template_hash() -> str:
+    """Hash de este archivo (plantilla CSS incluida), guardado en el paquete generado."""
+    with open(__file__, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()[:16]
+
+
+def bundle_is_stale(path: str = STYLE_BUNDLE_PATH, assets_dir: str = ASSETS_DIR) -> bool:
+    """True si el paquete no existe o alguna imagen o este script es más reciente que él."""
+    if not os.path.exists(path):
+        return True
+    generado = os.path.getmtime(path)
+    fuentes = [os.path.abspath(__file__)] + [os.path.join(assets_dir, nombre) for nombre in STYLE_SOURCES]
+    return any(os.path.getmtime(f) > generado for f in fuentes if os.path.exists(f))
+
+
+def load_bundle(path: str = STYLE_BUNDLE_PATH):
+    """Paquete generado, o None si falta o está desactualizado (fechas o hash de la plantilla)."""
+    if bundle_is_stale(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        bundle = json.load(f)
+    return bundle if bundle.get("version") == template_hash() else None
+
+
+def main():
+    bundle = build_style_bundle()
+    with open(STYLE_BUNDLE_PATH, "w", encoding="utf-8") as f:
+        json.dump(bundle, f)
+    print(f"Estilos generados en {STYLE_BUNDLE_PATH} ({os.path.getsize(STYLE_BUNDLE_PATH) / 1024:,.0f} KB)")
+
+
+if __name__ == "__main__":
+    main()
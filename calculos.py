@@ -0,0 +1,356 @@
+"""
+Lógica de cálculo del simulador AGPE (CREG 174 de 2021).
+
+Funciones puras sobre NumPy, sin dependencias de Streamlit, para que puedan
+usarse tanto desde la app como desde los procesos del ejecutor de trabajos
+en segundo plano (`jobs.py`). Los perfiles y la facturación aceptan escalares
+(un cliente) o arreglos (N clientes) y operan sobre el último eje (24 horas).
+"""
+import csv
+import functools
+import os
+
+import numpy as np
+
+
+@functools.lru_cache(maxsize=None)
+def _numpy_financial():
+    """numpy_financial se importa al primer cálculo financiero, no al cargar el módulo.
+
+    Así no pesa en el arranque de la app ni en los procesos de trabajo, que no lo usan.
+    """
+    try:
+        import numpy_financial as npf
+    except ImportError:
+        npf = None
+    return npf
+
+def calculate_irr(values):
+    """Calcula la Tasa Interna de Retorno (IRR)."""
+    npf = _numpy_financial()
+    if npf:
+        return npf.irr(values)
+    
+    # Fallback básico si numpy_financial no está instalado (usando numpy < 1.24 si tiene irr, o aproximación)
+    # Numpy 1.24+ eliminó np.irr.
+    try:
+        return np.irr(values)
+    except AttributeError:
+        # Implementación simple de Newton-Raphson para IRR
+        res = 0.1
+        for _ in range(20):
+            npv = 0
+            d_npv = 0
+            for t, val in enumerate(values):
+                npv += val / ((1 + res) ** t)
+                d_npv -= t * val / ((1 + res) ** (t + 1))
+            if abs(d_npv) < 1e-6:
+                return res
+            res = res - npv / d_npv
+            if abs(npv) < 1e-6:
+                return res
+        return res
+
+def calculate_npv(rate, values):
+    """Calcula el Valor Presente Neto (NPV)."""
+    npf = _numpy_financial()
+    if npf:
+        return npf.npv(rate, values)
+    try:
+        return np.npv(rate, values)
+    except AttributeError:
+        values = np.asarray(values)
+        t = np.arange(len(values))
+        return (values / (1 + rate) ** t).sum()
+
+
+# -----------------------------------------------------------------------------
+# PERFILES HORARIOS Y LIQUIDACIÓN
+# -----------------------------------------------------------------------------
+LATITUD_REF = 4.6           # Bogotá, usada si no se indica la ubicación del proyecto
+FRACCION_DIFUSA = 0.30      # Fracción difusa promedio de la irradiancia en Colombia
+
+# Multiplicadores horarios del consumo (madrugada, mañana, mediodía, tarde-noche, noche)
+CONSUMPTION_MULTIPLIERS = np.array([0.35] * 8 + [1.15] * 3 + [1.65] * 6 + [1.30] * 5 + [0.55] * 2)
+
+def hourly_consumption_profile(monthly_consumption_kwh) -> np.ndarray:
+    consumo = np.asarray(monthly_consumption_kwh, dtype=float)[..., None]
+    base = consumo / 30.0 / 24.0
+    
+    ruido = np.random.uniform(0.8, 1.2, consumo.shape[:-1] + (24,))
+    profile = (base * CONSUMPTION_MULTIPLIERS) * ruido
+    total = profile.sum(axis=-1, keepdims=True)
+    scale = np.divide(consumo / 30.0, total, out=np.ones_like(total), where=total > 0)
+    return profile * scale
+
+def solar_generation_profile(monthly_consumption_kwh, percent_comp) -> np.ndarray:
+    hours = np.arange(24)
+    raw = np.sin(np.pi * (hours - 6) / 12.0)
+    raw = np.clip(raw, 0, None)
+    daily_raw_sum = raw.sum()
+    target_monthly_gen = np.asarray(monthly_consumption_kwh, dtype=float) * (np.clip(percent_comp, 0, None) / 100.0)
+    scale = target_monthly_gen / (daily_raw_sum * 30.0)
+    gen = raw * scale[..., None]
+    return gen
+
+def multi_array_generation_profile(kwp_total: float, hsp: float, fracciones: np.ndarray, azimuts: np.ndarray,
+                                   inclinaciones: np.ndarray, relacion_dc_ac: float, latitud: float = LATITUD_REF) -> dict:
+    """Generación horaria (día típico) de K sub-arreglos que comparten un inversor.
+
+    Cada sub-arreglo tiene su fracción del kWp total, azimut (grados desde el norte,
+    180 = sur) e inclinación. La irradiancia en el plano de cada arreglo se calcula
+    como una sola operación (K x 24) y se calibra con las HSP sobre el plano
+    horizontal, de modo que un arreglo horizontal reproduce `solar_generation_profile`.
+    El recorte del inversor (kWp / relación DC/AC) se aplica hora a hora sobre la suma;
+    el límite se devuelve en `limite_ac` para recortar también cada mes (`monthly_energy`).
+    """
+    hours = np.arange(24)
+    omega = np.radians(15.0 * (hours - 12.0))   # ángulo horario
+    phi = np.radians(latitud)
+    # Vector solar (este, norte, cenit) para la declinación media anual (equinoccio)
+    sol = np.stack([-np.sin(omega), -np.sin(phi) * np.cos(omega), np.cos(phi) * np.cos(omega)])
+    elevacion = np.clip(sol[2], 0, None)
+    if elevacion.sum() == 0 or kwp_total <= 0 or hsp <= 0 or len(fracciones) == 0:
+        return {"dc": np.zeros((len(fracciones), 24)), "ac": np.zeros(24), "recorte": np.zeros(24), "limite_ac": np.inf}
+
+    az = np.radians(np.asarray(azimuts, dtype=float))
+    beta = np.radians(np.asarray(inclinaciones, dtype=float))
+    normales = np.stack([np.sin(beta) * np.sin(az), np.sin(beta) * np.cos(az), np.cos(beta)], axis=1)  # (K, 3)
+
+    directa = np.clip(normales @ sol, 0, None) * (elevacion > 0)          # (K, 24)
+    difusa = ((1 + np.cos(beta)) / 2)[:, None] * elevacion                # (K, 24)
+    poa = (1 - FRACCION_DIFUSA) * directa + FRACCION_DIFUSA * difusa
+
+    fracciones = np.asarray(fracciones, dtype=float)
+    kwp_arreglos = kwp_total * fracciones / fracciones.sum()
+    dc = kwp_arreglos[:, None] * hsp * poa / elevacion.sum()              # kWh/h por arreglo
+    dc_total = dc.sum(axis=0)
+    limite_ac = kwp_total / relacion_dc_ac if relacion_dc_ac > 0 else np.inf
+    ac = np.minimum(dc_total, limite_ac)
+    return {"dc": dc, "ac": ac, "recorte": dc_total - ac, "limite_ac": limite_ac}
+
+def settle_hourly(demand: np.ndarray, generation: np.ndarray) -> dict:
+    autoconsumo = np.minimum(generation, demand)
+    excedente = np.maximum(generation - demand, 0.0)
+    importada = np.maximum(demand - generation, 0.0)
+    return {
+        "demand": demand, "generation": generation,
+        "autoconsumo": autoconsumo, "excedente": excedente, "importada": importada,
+    }
+
+
+def billing(monthly_consumption_kwh: float, hourly: dict, CU: float, C: float, precio_bolsa: float, factor_contribucion:float,) -> dict:
+    autoconsumo_mes = hourly["autoconsumo"].sum(axis=-1) * 30.0
+    excedente_total_mes = hourly["excedente"].sum(axis=-1) * 30.0
+    importada_mes = hourly["importada"].sum(axis=-1) * 30.0
+    return settle_period(monthly_consumption_kwh, autoconsumo_mes, excedente_total_mes, importada_mes,
+                         CU, C, precio_bolsa, factor_contribucion)
+
+
+def settle_period(consumo_mes, autoconsumo_mes, excedente_total_mes, importada_mes,
+                  CU, C, precio_bolsa, factor_contribucion) -> dict:
+    """Factura de un periodo CREG 174 a partir de la energía del periodo (kWh).
+
+    Los Excedentes Tipo 1 (hasta la energía importada) se compensan a CU pagando
+    la comercialización C; los Tipo 2 se venden a precio de bolsa. Todos los
+    argumentos admiten arreglos con broadcasting (clientes, meses o ambos).
+    """
+    exc_tipo1 = np.minimum(excedente_total_mes, importada_mes)
+    exc_tipo2 = np.maximum(0, excedente_total_mes - importada_mes)
+
+    # --- LÓGICA DE CONTRIBUCIÓN CORREGIDA ---
+    # La contribución se cobra sobre los kWh netos (Importados - Compensados T1)
+    kwh_netos_a_pagar = np.maximum(0, importada_mes - exc_tipo1)
+    # El valor base es la tarifa CU por esos kWh netos
+    valor_base_contribucion = kwh_netos_a_pagar * CU
+    contribucion = valor_base_contribucion * (factor_contribucion / 100)
+    # ----------------------------------------
+    
+    costo_sin_proyecto = consumo_mes * CU*(1+(factor_contribucion/100))
+    
+    valor_importada = importada_mes * CU
+    
+    costo_intercambio_t1 = exc_tipo1 * C
+    credito_t1 = exc_tipo1 * -CU
+    credito_t2 = exc_tipo2 * -precio_bolsa
+
+    # Ahorro de contribución por Autoconsumo (Energía que no pasó por el medidor)
+    ahorro_contrib_auto = (autoconsumo_mes * CU) * (factor_contribucion / 100)
+    
+    # Ahorro de contribución por Excedentes T1 (Energía compensada 1 a 1)
+    ahorro_contrib_t1 = (exc_tipo1 * CU) * (factor_contribucion / 100)
+    
+    # Total ahorro en contribución
+    total_ahorro_contribucion = ahorro_contrib_auto + ahorro_contrib_t1
+    
+    costo_con_proyecto = valor_importada + contribucion+costo_intercambio_t1 + credito_t1 + credito_t2
+    
+    ahorro_autoconsumo = autoconsumo_mes * CU
+    beneficio_neto_excedentes = np.abs(credito_t1 + credito_t2) - costo_intercambio_t1
+    
+    return {
+        "autoconsumo_mes": autoconsumo_mes,
+        "importada_mes": importada_mes,
+        "v_contribucion":contribucion,
+        "exc_tipo1": exc_tipo1,
+        "exc_tipo2": exc_tipo2,
+        "costo_sin": costo_sin_proyecto,
+        "costo_con": costo_con_proyecto,
+        "v_importada": valor_importada,
+        "v_intercambio": costo_intercambio_t1,
+        "v_credito_t1": credito_t1,
+        "v_credito_t2": credito_t2,
+        "v_ahorro_auto": ahorro_autoconsumo,
+        "v_ahorro_contribucion": total_ahorro_contribucion,
+        "v_beneficio_exc": beneficio_neto_excedentes
+    }
+
+
+# -----------------------------------------------------------------------------
+# LIQUIDACIÓN MENSUAL CREG 174 (12 PERIODOS)
+# -----------------------------------------------------------------------------
+MESES = ["Ene", "Feb", "Mar", "Abr", "May", "Jun", "Jul", "Ago", "Sep", "Oct", "Nov", "Dic"]
+DIAS_PERIODO = 30.0         # igual que el mes típico de `billing`: 12 periodos = 12 meses típicos
+
+def monthly_energy(demand: np.ndarray, generation: np.ndarray, factor_generacion, factor_consumo=None,
+                   limite_ac=None) -> dict:
+    """Energía de los 12 periodos (kWh) a partir del día típico y la estacionalidad.
+
+    `demand` y `generation` son perfiles (..., 24); `factor_generacion` y
+    `factor_consumo` escalan el día típico en cada mes, (..., 12) o (12,) (1.0 =
+    mes típico). El reparto autoconsumo / excedente / importación se recalcula
+    hora a hora en cada mes, que es lo que mueve energía entre Tipo 1 y Tipo 2.
+
+    Con `limite_ac` (kW, escalar o (...,)) `generation` es la potencia DC y cada
+    mes se recorta al límite del inversor después de aplicar su factor: el recorte
+    crece en los meses de más irradiancia en vez de escalar un perfil ya recortado.
+    """
+    factor_generacion = np.asarray(factor_generacion, dtype=float)
+    # Un solo arreglo (..., 12, 24): la generación de cada mes, recortada en sitio al
+    # inversor (si aplica) y después a la demanda
+    horario = generation[..., None, :] * factor_generacion[..., None]
+    if limite_ac is None:
+        generacion_mes = generation.sum(axis=-1)[..., None] * factor_generacion * DIAS_PERIODO
+    else:
+        np.minimum(horario, np.asarray(limite_ac, dtype=float)[..., None, None], out=horario)
+        generacion_mes = horario.sum(axis=-1) * DIAS_PERIODO
+    if factor_consumo is None:
+        demanda_mes = np.broadcast_to(demand.sum(axis=-1)[..., None] * DIAS_PERIODO, generacion_mes.shape)
+        demanda = demand[..., None, :]
+    else:
+        factor_consumo = np.asarray(factor_consumo, dtype=float)
+        demanda_mes = demand.sum(axis=-1)[..., None] * factor_consumo * DIAS_PERIODO
+        demanda = demand[..., None, :] * factor_consumo[..., None]
+
+    autoconsumo_mes = np.minimum(horario, demanda, out=horario).sum(axis=-1) * DIAS_PERIODO
+    return {
+        "consumo": demanda_mes,
+        "generacion": generacion_mes,
+        "autoconsumo": autoconsumo_mes,
+        "excedente": generacion_mes - autoconsumo_mes,
+        "importada": demanda_mes - autoconsumo_mes,
+    }
+
+def monthly_ledger(energia: dict, CU, C, precio_bolsa, factor_contribucion) -> dict:
+    """Libro CREG 174 de 12 periodos: la factura de cada mes en una sola operación.
+
+    `energia` viene de `monthly_energy` (arreglos (..., 12)). Los parámetros se
+    combinan por broadcasting con esa forma: un valor por mes es (12,) y uno por
+    cliente de un portafolio va como (N, 1). Agrega los totales anuales
+    (`*_anual`) de energía y dinero.
+    """
+    libro = settle_period(energia["consumo"], energia["autoconsumo"], energia["excedente"], energia["importada"],
+                          CU, C, precio_bolsa, factor_contribucion)
+    libro["generacion_mes"] = energia["generacion"]
+    libro["ahorro"] = libro["costo_sin"] - libro["costo_con"]
+    for clave in ("exc_tipo1", "exc_tipo2", "costo_sin", "costo_con", "ahorro",
+                  "v_credito_t1", "v_credito_t2", "v_contribucion", "v_intercambio"):
+        libro[f"{clave}_anual"] = libro[clave].sum(axis=-1)
+    return libro
+
+
+# -----------------------------------------------------------------------------
+# ANÁLISIS DE PORTAFOLIO (se ejecuta en segundo plano, ver jobs.py)
+# -----------------------------------------------------------------------------
+def simulate_portfolio(progreso, consumo: np.ndarray, CU: np.ndarray, C: np.ndarray, precio_bolsa: np.ndarray,
+                       factor_contribucion: np.ndarray, percent: np.ndarray, hsp: np.ndarray, bloque: int = 20_000,
+                       factor_generacion_mensual: np.ndarray = None, factor_bolsa_mensual: np.ndarray = None) -> dict:
+    """Simula N clientes (día típico horario + factura mensual) por bloques de filas.
+
+    Todos los parámetros son arreglos de N elementos (o escalares). `progreso` es el
+    objeto que entrega el ejecutor de trabajos: `progreso.update(fraccion)` reporta el
+    avance y aborta el cálculo si el trabajo fue reemplazado por uno más reciente.
+
+    Además liquida los 12 periodos CREG 174 de cada cliente (N x 12) con la
+    estacionalidad de la generación, (N, 12) o (12,), y del precio de bolsa, (12,);
+    sin ellas cada periodo es el mes típico.
+    """
+    consumo = np.asarray(consumo, dtype=float)
+    n = consumo.shape[0]
+    CU, C, precio_bolsa, factor_contribucion, percent, hsp = (
+        np.broadcast_to(np.asarray(x, dtype=float), (n,))
+        for x in (CU, C, precio_bolsa, factor_contribucion, percent, hsp)
+    )
+
+    factor_generacion = np.ones(12) if factor_generacion_mensual is None else np.asarray(factor_generacion_mensual, dtype=float)
+    factor_bolsa = np.ones(12) if factor_bolsa_mensual is None else np.asarray(factor_bolsa_mensual, dtype=float)
+
+    horario = {k: np.empty((n, 24)) for k in ("demand", "generation", "autoconsumo", "excedente", "importada")}
+    mensual = {k: np.empty(n) for k in ("costo_sin", "costo_con", "exc_tipo1", "exc_tipo2")}
+    periodos = {k: np.empty((n, 12)) for k in ("exc_tipo1", "exc_tipo2", "costo_con", "ahorro")}
+    for inicio in range(0, n, bloque):
+        sl = slice(inicio, min(inicio + bloque, n))
+        demand = hourly_consumption_profile(consumo[sl])
+        generation = solar_generation_profile(consumo[sl], percent[sl])
+        hourly = settle_hourly(demand, generation)
+        bill = billing(consumo[sl], hourly, CU[sl], C[sl], precio_bolsa[sl], factor_contribucion[sl])
+        libro = monthly_ledger(
+            monthly_energy(demand, generation, factor_generacion[sl] if factor_generacion.ndim == 2 else factor_generacion),
+            CU[sl, None], C[sl, None], precio_bolsa[sl, None] * factor_bolsa, factor_contribucion[sl, None],
+        )
+        for k in horario:
+            horario[k][sl] = hourly[k]
+        for k in mensual:
+            mensual[k][sl] = bill[k]
+        for k in periodos:
+            periodos[k][sl] = libro[k]
+        progreso.update(sl.stop / n)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        kwp = np.where(hsp > 0, consumo * (percent / 100) / (30 * hsp), 0.0)
+    return {**horario, **mensual, **{f"{k}_periodos": v for k, v in periodos.items()},
+            "kwp": kwp, "ahorro": mensual["costo_sin"] - mensual["costo_con"],
+            "ahorro_anual": periodos["ahorro"].sum(axis=1)}
+
+
+# -----------------------------------------------------------------------------
+# IMPACTO AMBIENTAL
+# -----------------------------------------------------------------------------
+FACTOR_EMISION_SIN = 0.1643  # tCO2e / MWh (UPME/XM), promedio anual del SIN
+FACTORES_EMISION_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "factores_emision.csv")
+
+def load_emission_factors(path: str = FACTORES_EMISION_PATH) -> np.ndarray:
+    """Carga la tabla de factores de emisión marginal del SIN (12 meses x 24 horas, tCO2e/MWh).
+
+    Acepta una tabla horaria (mes, hora, factor) o solo mensual (mes, factor).
+    Si el archivo no existe o le faltan celdas se usa el factor promedio del SIN.
+    """
+    factores = np.full((12, 24), np.nan)
+    if os.path.exists(path):
+        with open(path, newline="", encoding="utf-8") as f:
+            filas = [r for r in csv.DictReader(f) if r.get("factor_tco2_mwh")]
+        meses = np.array([int(r["mes"]) for r in filas], dtype=int) - 1
+        valores = np.array([float(r["factor_tco2_mwh"]) for r in filas])
+        if filas and "hora" in filas[0]:
+            factores[meses, np.array([int(r["hora"]) for r in filas], dtype=int)] = valores
+        else:
+            factores[meses, :] = valores[:, None]
+    return np.where(np.isnan(factores), FACTOR_EMISION_SIN, factores)
+
+def co2_avoided_monthly(energia_desplazada: np.ndarray, factores: np.ndarray) -> np.ndarray:
+    """CO2 evitado por mes (tCO2e) a partir del perfil horario de energía desplazada.
+
+    `energia_desplazada` es el día típico en kWh/h (autoconsumo + excedente) y
+    `factores` la tabla (12, 24) en tCO2e/MWh: un solo producto matricial.
+    """
+    return (factores @ energia_desplazada) * 30.0 / 1000.0
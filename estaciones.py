@@ -0,0 +1,175 @@
+"""
+HSP e irradiancia mensual por ubicación: estación más cercana con índice espacial.
+
+La tabla `data/estaciones_hsp.csv` tiene una fila por municipio / estación con
+su latitud, longitud, HSP anual y la irradiancia media diaria de cada mes
+(kWh/m²·día, numéricamente igual a las HSP del mes).
+
+El índice es una malla regular (`CELDA_GRADOS`) que cubre las estaciones con
+un margen. Para cada celda se guardan de antemano las estaciones que pueden ser
+la más cercana a algún punto de la celda (por desigualdad triangular: las que
+están a menos de `d_min + diagonal` del centro), así que una consulta es:
+
+    celda = floor((lat, lon) / paso) -> candidatos -> argmin de unas pocas distancias
+
+Todo opera sobre arreglos: un punto o 100k clientes de un portafolio se
+resuelven con la misma llamada. Los puntos fuera de la malla se resuelven por
+fuerza bruta (son casos raros y siguen siendo vectorizados).
+
+Las distancias usan una proyección equirectangular centrada en `LATITUD_REF`,
+suficiente para elegir la estación dentro de Colombia.
+"""
+import csv
+import os
+
+import numpy as np
+
+from calculos import LATITUD_REF
+
+ESTACIONES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "estaciones_hsp.csv")
+CELDA_GRADOS = 0.05         # ~5.5 km
+MARGEN_GRADOS = 1.0
+KM_POR_GRADO = 111.2
+_COS_REF = float(np.cos(np.radians(LATITUD_REF)))
+
+
+class StationIndex:
+    """Estaciones con HSP e irradiancia mensual y su índice de malla precalculado.
+
+    Se construye una vez por proceso y se comparte entre sesiones como solo lectura.
+    """
+
+    def __init__(self, municipios, departamentos, latitud, longitud, hsp, irradiancia, celda: float = CELDA_GRADOS):
+        self.municipios = list(municipios)
+        self.departamentos = list(departamentos)
+        self.latitud = np.asarray(latitud, dtype=float)
+        self.longitud = np.asarray(longitud, dtype=float)
+        self.hsp = np.asarray(hsp, dtype=float)
+        self.irradiancia = np.asarray(irradiancia, dtype=float).reshape(len(self.hsp), 12)
+        self.etiquetas = [m if m == d else f"{m} ({d})" for m, d in zip(self.municipios, self.departamentos)]
+        self._por_etiqueta = {e: i for i, e in enumerate(self.etiquetas)}
+        self._build(celda)
+
+    def __len__(self) -> int:
+        return len(self.hsp)
+
+    def _distance(self, lat, lon, estaciones) -> np.ndarray:
+        """Distancia en grados proyectados entre puntos y estaciones (con broadcasting)."""
+        dx = (lon - self.longitud[estaciones]) * _COS_REF
+        dy = lat - self.latitud[estaciones]
+        return np.hypot(dx, dy)
+
+    def _build(self, celda: float):
+        self._celda = celda
+        self._lat0 = self.latitud.min() - MARGEN_GRADOS
+        self._lon0 = self.longitud.min() - MARGEN_GRADOS
+        n_lat = int(np.ceil((self.latitud.max() + MARGEN_GRADOS - self._lat0) / celda))
+        n_lon = int(np.ceil((self.longitud.max() + MARGEN_GRADOS - self._lon0) / celda))
+        diagonal = np.hypot(celda * _COS_REF, celda)
+        todas = np.arange(len(self))
+
+        # Fila por fila de la malla para no materializar celdas x estaciones completo
+        lon_c = self._lon0 + (np.arange(n_lon) + 0.5) * celda
+        filas = []
+        for i in range(n_lat):
+            lat_c = self._lat0 + (i + 0.5) * celda
+            d = self._distance(lat_c, lon_c[:, None], todas[None, :])     # (n_lon, S)
+            orden = np.argsort(d, axis=1)
+            d_ordenada = np.take_along_axis(d, orden, axis=1)
+            cuantos = (d_ordenada <= d_ordenada[:, :1] + diagonal).sum(axis=1)
+            filas.append((orden, cuantos))
+        k = max(int(c.max()) for _, c in filas)
+
+        # Candidatos por celda, completados con la estación más cercana al centro.
+        # int16 alcanza para la tabla de municipios; con más estaciones se usa intp
+        tipo = np.int16 if len(self) <= np.iinfo(np.int16).max else np.intp
+        candidatos = np.empty((n_lat, n_lon, k), dtype=tipo)
+        for i, (orden, cuantos) in enumerate(filas):
+            fila = orden[:, :k]
+            candidatos[i] = np.where(np.arange(k) < cuantos[:, None], fila, fila[:, :1])
+        self._candidatos = candidatos
+
+    def nearest(self, latitud, longitud):
+        """Índice de la estación más cercana y distancia en km para cada punto.
+
+        Acepta escalares o arreglos (con broadcasting); devuelve arreglos de la misma
+        forma. Los puntos sin coordenadas (NaN) quedan con índice -1 y distancia NaN.
+        """
+        lat, lon = np.broadcast_arrays(np.asarray(latitud, dtype=float), np.asarray(longitud, dtype=float))
+        lat, lon = lat.ravel(), lon.ravel()
+        finito = np.isfinite(lat) & np.isfinite(lon)
+        i = np.floor((np.where(finito, lat, self._lat0 - 1.0) - self._lat0) / self._celda).astype(np.intp)
+        j = np.floor((np.where(finito, lon, self._lon0) - self._lon0) / self._celda).astype(np.intp)
+        n_lat, n_lon, _ = self._candidatos.shape
+        dentro = (i >= 0) & (i < n_lat) & (j >= 0) & (j < n_lon)
+        fuera = ~dentro & finito
+
+        indices = np.empty(lat.shape, dtype=np.intp)
+        distancia = np.empty(lat.shape, dtype=float)
+        candidatos = self._candidatos[i[dentro], j[dentro]]                 # (M, K)
+        d = self._distance(lat[dentro, None], lon[dentro, None], candidatos)
+        mejor = d.argmin(axis=1)
+        indices[dentro] = candidatos[np.arange(len(candidatos)), mejor]
+        distancia[dentro] = d[np.arange(len(d)), mejor]
+
+        if fuera.any():
+            d = self._distance(lat[fuera, None], lon[fuera, None], np.arange(len(self))[None, :])
+            indices[fuera] = d.argmin(axis=1)
+            distancia[fuera] = d.min(axis=1)
+        indices[~finito] = -1
+        distancia[~finito] = np.nan
+
+        forma = np.broadcast(np.asarray(latitud), np.asarray(longitud)).shape
+        return indices.reshape(forma), (distancia * KM_POR_GRADO).reshape(forma)
+
+    def seasonality(self, indices) -> np.ndarray:
+        """Factores mensuales de generación (..., 12) de las estaciones dadas.
+
+        Los índices -1 (sin coordenadas) quedan sin estacionalidad (todos 1.0).
+        """
+        indices = np.asarray(indices)
+        factores = seasonal_factors(self.irradiancia[indices])
+        return np.where((indices >= 0)[..., None], factores, 1.0)
+
+    def station(self, indice: int) -> dict:
+        """Datos de una estación: nombre, ubicación, HSP anual e irradiancia mensual."""
+        return {
+            "municipio": self.municipios[indice],
+            "departamento": self.departamentos[indice],
+            "etiqueta": self.etiquetas[indice],
+            "latitud": float(self.latitud[indice]),
+            "longitud": float(self.longitud[indice]),
+            "hsp": float(self.hsp[indice]),
+            "irradiancia": self.irradiancia[indice],
+        }
+
+    def lookup(self, latitud: float, longitud: float) -> dict:
+        """Estación más cercana a un punto, con la distancia en km."""
+        indice, distancia = self.nearest(latitud, longitud)
+        return {**self.station(int(indice)), "distancia_km": float(distancia)}
+
+    def by_label(self, etiqueta: str) -> dict:
+        """Estación por su etiqueta ("Municipio (Departamento)"); KeyError si no existe."""
+        return {**self.station(self._por_etiqueta[etiqueta]), "distancia_km": 0.0}
+
+
+def seasonal_factors(irradiancia) -> np.ndarray:
+    """Irradiancia mensual relativa a su promedio (1.0 = mes típico), sobre el último eje."""
+    irradiancia = np.asarray(irradiancia, dtype=float)
+    promedio = irradiancia.mean(axis=-1, keepdims=True)
+    return np.divide(irradiancia, promedio, out=np.ones_like(irradiancia), where=promedio > 0)
+
+
+def load_stations(path: str = ESTACIONES_PATH) -> StationIndex:
+    """Lee la tabla de estaciones y construye el índice (una vez por proceso desde la app)."""
+    with open(path, newline="", encoding="utf-8") as f:
+        filas = list(csv.DictReader(f))
+    columnas_mes = [f"irr_{m:02d}" for m in range(1, 13)]
+    return StationIndex(
+        [r["municipio"] for r in filas],
+        [r["departamento"] for r in filas],
+        [float(r["latitud"]) for r in filas],
+        [float(r["longitud"]) for r in filas],
+        [float(r["hsp"]) for r in filas],
+        [[float(r[c]) for c in columnas_mes] for r in filas],
+    )
@@ -0,0 +1,109 @@
+"""
+Exportación columnar (Arrow / Parquet) de la liquidación horaria.
+
+Las columnas se construyen directamente sobre los buffers NumPy de
+`settle_hourly` / `simulate_portfolio` sin copiarlos (arreglos contiguos
+float64 sin nulos) y las tablas grandes se escriben por lotes de registros,
+de modo que un portafolio de 100k clientes x 8760 horas nunca se materializa
+completo en memoria (ni como DataFrame de pandas ni como tabla Arrow).
+
+Formatos:
+* Un cliente: una fila por hora (24 del día típico o 8760 del año).
+* Portafolio: una fila por cliente; cada magnitud horaria es una columna
+  `fixed_size_list<double>[24 | 8760]`.
+"""
+import numpy as np
+import pyarrow as pa
+
+SETTLEMENT_KEYS = ("demand", "generation", "autoconsumo", "excedente", "importada")
+HORAS_ANIO = 8760
+FILAS_POR_LOTE = 2_000
+FILAS_POR_LOTE_ANUAL = 100      # ~35 MB por lote con las 5 magnitudes a 8760 h
+
+
+def _column(arr: np.ndarray) -> pa.Array:
+    """Columna Arrow sobre el buffer NumPy (sin copia si el arreglo es contiguo)."""
+    arr = np.asarray(arr)
+    if arr.ndim == 1:
+        return pa.array(arr)
+    valores = pa.array(np.ascontiguousarray(arr).reshape(-1))
+    return pa.FixedSizeListArray.from_arrays(valores, arr.shape[1])
+
+
+def record_batches(columnas: dict, filas_por_lote: int = FILAS_POR_LOTE):
+    """Genera lotes de registros a partir de columnas NumPy de igual número de filas.
+
+    Las columnas 2D (N x horas) se exportan como listas de tamaño fijo; cada lote
+    es una vista de `filas_por_lote` filas, sin copiar los datos.
+    """
+    n = len(next(iter(columnas.values())))
+    for inicio in range(0, max(n, 1), filas_por_lote):
+        fin = min(inicio + filas_por_lote, n)
+        yield pa.RecordBatch.from_arrays(
+            [_column(v[inicio:fin]) for v in columnas.values()], names=list(columnas)
+        )
+
+
+def annual_record_batches(horario: dict, columnas_cliente: dict = None, filas_por_lote: int = FILAS_POR_LOTE_ANUAL):
+    """Lotes del portafolio con el año completo (8760 h) a partir del día típico (N x 24).
+
+    El año se arma repitiendo el día típico lote por lote, así que en memoria solo
+    vive un lote anual a la vez. `columnas_cliente` agrega columnas 1D por cliente
+    (id, kWp, costos...).
+    """
+    columnas_cliente = columnas_cliente or {}
+    n = len(horario[SETTLEMENT_KEYS[0]])
+    dias = HORAS_ANIO // 24
+    for inicio in range(0, max(n, 1), filas_por_lote):
+        fin = min(inicio + filas_por_lote, n)
+        columnas = {k: _column(v[inicio:fin]) for k, v in columnas_cliente.items()}
+        for k in SETTLEMENT_KEYS:
+            columnas[k] = _column(np.tile(horario[k][inicio:fin], dias))
+        yield pa.RecordBatch.from_arrays(list(columnas.values()), names=list(columnas))
+
+
+def hourly_columns(hourly: dict, anual: bool = False) -> dict:
+    """Columnas de un solo cliente: una fila por hora del día típico o del año."""
+    if anual:
+        dias = HORAS_ANIO // 24
+        columnas = {"hora_anio": np.arange(HORAS_ANIO, dtype=np.int32),
+                    "hora": np.tile(np.arange(24, dtype=np.int32), dias)}
+        columnas.update({k: np.tile(hourly[k], dias) for k in SETTLEMENT_KEYS})
+        return columnas
+    return {"hora": np.arange(24, dtype=np.int32), **{k: hourly[k] for k in SETTLEMENT_KEYS}}
+
+
+def write_parquet(sink, batches, compression: str = "zstd"):
+    """Escribe los lotes en Parquet a medida que se generan (`sink`: ruta o archivo)."""
+    # pyarrow.parquet tarda ~0.3 s en importarse: solo se carga al primer export
+    import pyarrow.parquet as pq
+
+    writer = None
+    try:
+        for batch in batches:
+            if writer is None:
+                writer = pq.ParquetWriter(sink, batch.schema, compression=compression)
+            writer.write_batch(batch)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def write_arrow(sink, batches):
+    """Escribe los lotes como stream IPC de Arrow (`.arrow`), también por lotes."""
+    writer = None
+    try:
+        for batch in batches:
+            if writer is None:
+                writer = pa.ipc.new_stream(sink, batch.schema)
+            writer.write_batch(batch)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def to_bytes(write_fn, batches) -> bytes:
+    """Serializa en memoria para `st.download_button` (solo para tablas de tamaño moderado)."""
+    sink = pa.BufferOutputStream()
+    write_fn(sink, batches)
+    return sink.getvalue().to_pybytes()
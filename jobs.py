@@ -0,0 +1,332 @@
+"""
+Ejecución de análisis pesados en segundo plano.
+
+Los análisis largos (portafolios, barridos, proyecciones horarias de varios
+años) corren en un pool de procesos compartido por todas las sesiones, de modo
+que el hilo del script de Streamlit nunca queda bloqueado:
+
+* Cada trabajo se identifica por el hash de su función y sus argumentos; los
+  resultados se guardan en una caché LRU acotada con esa llave.
+* El progreso y la señal de cancelación viajan por un bloque de memoria
+  compartida de 16 bytes, que la UI consulta sin esperar al proceso.
+* Un trabajo nuevo en el mismo escenario reemplaza y cancela al anterior.
+* Un trabajo con error (o cancelado en su escenario) no se relanza al volver
+  a enviarlo con los mismos argumentos: la UI ve el error en lugar de un ciclo
+  de reintentos en cada rerun.
+* Si un proceso de trabajo muere (p. ej. por falta de memoria), el pool se
+  reconstruye y los trabajos afectados quedan en estado de error.
+* Los arreglos NumPy grandes del resultado se devuelven por memoria
+  compartida en lugar de serializarse con pickle.
+"""
+import atexit
+import hashlib
+import multiprocessing as mp
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from concurrent.futures import CancelledError, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Arreglos a partir de este tamaño viajan por memoria compartida
+SHM_MIN_BYTES = 64 * 1024
+# Tope de la caché de resultados en bytes (además del número de entradas)
+MAX_RESULT_BYTES = 512 * 1024 ** 2
+_SHM_TAG = "__shm__"
+
+
+class JobCancelled(Exception):
+    """El trabajo fue reemplazado por uno más reciente del mismo escenario."""
+
+
+class _SharedBlock(shared_memory.SharedMemory):
+    """Bloque de memoria compartida que puede seguir mapeado por vistas NumPy.
+
+    Al recolectarse solo cierra el descriptor: el mmap lo mantienen vivo los
+    arreglos creados sobre él y se libera junto con el último de ellos (cerrarlo
+    antes dejaría esos arreglos apuntando a memoria ya desmapeada).
+    """
+
+    def __del__(self):
+        fd = getattr(self, "_fd", -1)
+        if fd >= 0:
+            os.close(fd)
+            self._fd = -1
+
+
+class Progress:
+    """Lado del proceso de trabajo del bloque de control: [progreso, cancelado]."""
+
+    def __init__(self, name: str):
+        self._shm = _SharedBlock(name=name)
+        self._ctrl = np.ndarray((2,), dtype=np.float64, buffer=self._shm.buf)
+
+    @property
+    def cancelled(self) -> bool:
+        return bool(self._ctrl[1])
+
+    def update(self, fraccion: float):
+        """Reporta el avance (0 a 1); lanza `JobCancelled` si el trabajo fue reemplazado."""
+        if self._ctrl[1]:
+            raise JobCancelled()
+        self._ctrl[0] = fraccion
+
+    def close(self):
+        del self._ctrl
+        self._shm.close()
+
+
+def job_hash(fn, args: tuple, kwargs: dict) -> str:
+    """Llave estable de un trabajo: función + argumentos (incluye el contenido de los arreglos)."""
+    payload = pickle.dumps((fn.__module__, fn.__qualname__, args, sorted(kwargs.items())), protocol=5)
+    return hashlib.sha256(payload).hexdigest()[:24]
+
+
+def _export_result(resultado: dict) -> dict:
+    """En el proceso de trabajo: copia los arreglos grandes a memoria compartida."""
+    exportado = {}
+    for clave, valor in resultado.items():
+        if isinstance(valor, np.ndarray) and valor.nbytes >= SHM_MIN_BYTES:
+            shm = shared_memory.SharedMemory(create=True, size=valor.nbytes)
+            np.ndarray(valor.shape, dtype=valor.dtype, buffer=shm.buf)[...] = valor
+            exportado[clave] = (_SHM_TAG, shm.name, valor.shape, valor.dtype.str)
+            shm.close()
+        else:
+            exportado[clave] = valor
+    return exportado
+
+
+def _import_result(resultado: dict) -> dict:
+    """En el proceso principal: expone los bloques compartidos como arreglos sin copiarlos.
+
+    El nombre del bloque se elimina de inmediato; la memoria sigue mapeada mientras
+    existan arreglos que la usen.
+    """
+    importado = {}
+    for clave, valor in resultado.items():
+        if isinstance(valor, tuple) and len(valor) == 4 and valor[0] == _SHM_TAG:
+            _, nombre, shape, dtype = valor
+            shm = _SharedBlock(name=nombre)
+            arr = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+            arr.flags.writeable = False
+            shm.unlink()
+            importado[clave] = arr
+        else:
+            importado[clave] = valor
+    return importado
+
+
+def _result_nbytes(resultado: dict) -> int:
+    return sum(v.nbytes for v in resultado.values() if isinstance(v, np.ndarray))
+
+
+def _run_job(fn, args: tuple, kwargs: dict, ctrl_name: str) -> dict:
+    progreso = Progress(ctrl_name)
+    try:
+        resultado = fn(progreso, *args, **kwargs)
+    finally:
+        progreso.close()
+    return _export_result(resultado)
+
+
+class JobManager:
+    """Pool de procesos compartido con caché de resultados y reemplazo por escenario.
+
+    `fn` debe ser una función importable (definida en un módulo, no en el script
+    de Streamlit) con la forma `fn(progreso, *args, **kwargs) -> dict`.
+
+    La caché de resultados se acota por número de entradas y por bytes de sus
+    arreglos (memoria compartida); el resultado más reciente se conserva aunque
+    por sí solo supere `max_result_bytes`.
+    """
+
+    def __init__(self, max_workers: int = None, max_results: int = 16, max_result_bytes: int = MAX_RESULT_BYTES):
+        self._max_workers = max_workers
+        self._pool = self._new_pool()
+        self._max_results = max_results
+        self._max_result_bytes = max_result_bytes
+        self._result_bytes = 0
+        self._results = OrderedDict()   # hash -> (resultado, bytes) (LRU)
+        self._errors = OrderedDict()    # hash -> mensaje de error (LRU)
+        self._cancelled = OrderedDict() # hash -> None, trabajos cancelados sin nadie esperándolos (LRU)
+        self._jobs = {}                 # hash -> trabajo en curso
+        self._scenarios = {}            # escenario -> hash del último trabajo enviado
+        self._lock = threading.Lock()
+
+    def submit(self, scenario: str, fn, *args, **kwargs) -> str:
+        """Envía un trabajo y devuelve su hash sin esperar el resultado.
+
+        Si el escenario tenía otro trabajo en curso, ese trabajo se cancela (salvo
+        que otro escenario también lo esté esperando). Un trabajo que terminó con
+        error no se relanza, ni uno cancelado si el escenario lo vuelve a enviar:
+        el estado se mantiene hasta que cambien los argumentos.
+        """
+        job_id = job_hash(fn, args, kwargs)
+        cancelar = []
+        try:
+            with self._lock:
+                anterior = self._scenarios.get(scenario)
+                self._scenarios[scenario] = job_id
+                if anterior is not None and anterior != job_id:
+                    cancelar = self._release_locked(anterior, scenario)
+
+                if job_id in self._results:
+                    self._results.move_to_end(job_id)
+                    return job_id
+                if job_id in self._errors or (anterior == job_id and job_id in self._cancelled):
+                    return job_id
+                if job_id in self._jobs:
+                    job = self._jobs[job_id]
+                    job["escenarios"].add(scenario)
+                    job["vista"][1] = 0.0       # retira la cancelación si el proceso aún no la vio
+                    return job_id
+                future = self._start_locked(job_id, scenario, fn, args, kwargs)
+        finally:
+            self._cancel(cancelar)
+        if future is not None:
+            future.add_done_callback(lambda f, job_id=job_id: self._finish(job_id, f))
+        return job_id
+
+    def _new_pool(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=self._max_workers, mp_context=mp.get_context("spawn"))
+
+    def _start_locked(self, job_id: str, scenario: str, fn, args: tuple, kwargs: dict):
+        """Crea el bloque de control y envía el trabajo al pool (con el lock tomado).
+
+        Si un proceso de trabajo murió, el pool queda roto para siempre: se reemplaza
+        por uno nuevo y se reintenta una vez. Devuelve None si el trabajo no se pudo
+        enviar (el error queda en `status()` en lugar de llegar a la UI).
+        """
+        ctrl = _SharedBlock(create=True, size=2 * np.dtype(np.float64).itemsize)
+        vista = np.ndarray((2,), dtype=np.float64, buffer=ctrl.buf)
+        vista[:] = 0.0
+        self._cancelled.pop(job_id, None)
+        try:
+            try:
+                future = self._pool.submit(_run_job, fn, args, kwargs, ctrl.name)
+            except BrokenProcessPool:
+                self._replace_pool_locked()
+                future = self._pool.submit(_run_job, fn, args, kwargs, ctrl.name)
+        except BrokenProcessPool as exc:
+            del vista
+            ctrl.unlink()
+            self._set_error_locked(job_id, f"{type(exc).__name__}: {exc}")
+            return None
+        self._jobs[job_id] = {"future": future, "ctrl": ctrl, "vista": vista, "escenarios": {scenario}}
+        return future
+
+    def _replace_pool_locked(self):
+        """Cambia el pool roto por uno nuevo; sus trabajos en curso quedan con error."""
+        roto, self._pool = self._pool, self._new_pool()
+        roto.shutdown(wait=False, cancel_futures=True)
+        for job_id, job in list(self._jobs.items()):
+            del self._jobs[job_id]
+            self._set_error_locked(job_id, "BrokenProcessPool: el proceso de trabajo terminó inesperadamente")
+            del job["vista"]
+            job["ctrl"].unlink()
+
+    def _set_error_locked(self, job_id: str, error: str):
+        self._errors[job_id] = error
+        while len(self._errors) > self._max_results:
+            self._errors.popitem(last=False)
+
+    def status(self, job_id: str) -> dict:
+        """Estado del trabajo: pendiente, ejecutando, terminado, error o cancelado (también si ya salió de la caché)."""
+        with self._lock:
+            if job_id in self._results:
+                self._results.move_to_end(job_id)
+                return {"estado": "terminado", "progreso": 1.0, "resultado": self._results[job_id][0], "error": None}
+            if job_id in self._jobs:
+                job = self._jobs[job_id]
+                estado = "ejecutando" if job["future"].running() else "pendiente"
+                return {"estado": estado, "progreso": float(job["vista"][0]), "resultado": None, "error": None}
+            if job_id in self._errors:
+                return {"estado": "error", "progreso": 0.0, "resultado": None, "error": self._errors[job_id]}
+        return {"estado": "cancelado", "progreso": 0.0, "resultado": None, "error": None}
+
+    def cancel(self, scenario: str):
+        """Cancela el trabajo en curso del escenario (si nadie más lo espera).
+
+        El escenario recuerda el trabajo: volver a enviarlo no lo relanza.
+        """
+        cancelar = []
+        with self._lock:
+            job_id = self._scenarios.get(scenario)
+            if job_id is not None:
+                cancelar = self._release_locked(job_id, scenario)
+        self._cancel(cancelar)
+
+    def shutdown(self):
+        with self._lock:
+            for job in self._jobs.values():
+                job["vista"][1] = 1.0
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def _release_locked(self, job_id: str, scenario: str) -> list:
+        """Suelta el escenario del trabajo; devuelve los futures a cancelar fuera del lock.
+
+        `Future.cancel()` de un trabajo pendiente ejecuta `_finish` en el mismo hilo,
+        y `_finish` toma el lock: llamarlo aquí dentro bloquearía el administrador.
+        """
+        job = self._jobs.get(job_id)
+        if job is None:
+            return []
+        job["escenarios"].discard(scenario)
+        if not job["escenarios"]:
+            job["vista"][1] = 1.0       # el proceso de trabajo lo verá en su próximo update()
+            return [job["future"]]      # si aún no había empezado, ni siquiera se ejecuta
+        return []
+
+    @staticmethod
+    def _cancel(futures: list):
+        for future in futures:
+            future.cancel()
+
+    def _finish(self, job_id: str, future):
+        resultado, error = None, None
+        try:
+            resultado = _import_result(future.result())
+        except (CancelledError, JobCancelled):
+            pass
+        except Exception as exc:  # el error se muestra en la UI en lugar de propagarse
+            error = f"{type(exc).__name__}: {exc}"
+
+        with self._lock:
+            # El trabajo pudo salir ya de `_jobs` (pool reemplazado) y otro con el mismo hash ocupar su lugar
+            job = self._jobs.get(job_id)
+            if job is None or job["future"] is not future:
+                return
+            del self._jobs[job_id]
+            if resultado is not None:
+                nbytes = _result_nbytes(resultado)
+                self._results[job_id] = (resultado, nbytes)
+                self._result_bytes += nbytes
+                while len(self._results) > 1 and (len(self._results) > self._max_results
+                                                  or self._result_bytes > self._max_result_bytes):
+                    _, (_, liberados) = self._results.popitem(last=False)
+                    self._result_bytes -= liberados
+            elif error is not None:
+                self._set_error_locked(job_id, error)
+            elif not job["escenarios"]:
+                self._cancelled[job_id] = None
+                while len(self._cancelled) > self._max_results:
+                    self._cancelled.popitem(last=False)
+        del job["vista"]
+        job["ctrl"].unlink()
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_job_manager() -> JobManager:
+    """Instancia única por proceso del servidor, compartida por todas las sesiones."""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = JobManager()
+            atexit.register(_manager.shutdown)
+        return _manager
@@ -0,0 +1,272 @@
+"""
+Prueba de carga del simulador: sesiones concurrentes sobre `streamlit_app.py`.
+
+Cada sesión simulada es un `AppTest` (arnés de pruebas headless de Streamlit)
+que reproduce una secuencia realista de interacción: arrastre del slider de
+compensación, cambios de consumo / tarifa / HSP y aperturas de expanders.
+Al final se reportan percentiles de latencia por rerun, crecimiento de RSS
+del proceso y CPU consumida por sesión.
+
+Uso:
+    python load_test.py --sesiones 20 --concurrencia 8 --pasos 15
+    python load_test.py --sesiones 50 --json resultados_antes.json
+
+Notas:
+    * Los expanders de Streamlit se abren en el navegador y no disparan un
+      rerun en el servidor; en el escenario se registran como pasos sin costo
+      para que la secuencia sea la misma que hace un usuario real.
+    * Todas las sesiones corren dentro de este proceso, de modo que la RSS y
+      la CPU reportadas corresponden a lo que consumiría una instancia del
+      servidor atendiendo esas sesiones.
+    * Antes de tomar la línea base de RSS y CPU se ejecuta una sesión de
+      calentamiento (imports de pandas / plotly / pyarrow, cachés por proceso),
+      así el crecimiento reportado es el marginal de cada sesión y no el costo
+      único de arranque.
+    * La CPU "por sesión" y "por rerun" son promedios (total / sesiones,
+      total / reruns), no mediciones individuales.
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Los avisos de Streamlit en modo headless no aportan a la medición, y los
+# exportadores de métricas (endpoint HTTP, archivo) no deben correr en el proceso medido
+os.environ.setdefault("STREAMLIT_LOGGER_LEVEL", "error")
+os.environ["AGPE_METRICS_PORT"] = "0"
+os.environ["AGPE_METRICS_FILE"] = ""
+
+from streamlit.testing.v1 import AppTest
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "streamlit_app.py")
+
+# Etiquetas de los widgets del sidebar que se modifican durante la prueba
+SLIDER_KEY = "percent_slider_sidebar"
+INPUT_RANGES = {
+    "Consumo mensual (kWh)": (300.0, 8000.0),
+    "Tarifa CU (COP/kWh)": (600.0, 1000.0),
+    "Precio de Bolsa (COP/kWh)": (150.0, 450.0),
+    "Horas Solar Pico": (3.0, 5.5),
+}
+
+
+# -----------------------------------------------------------------------------
+# 1. MEDICIÓN DE RECURSOS
+# -----------------------------------------------------------------------------
+def current_rss_mb() -> float:
+    """RSS actual del proceso en MB (Linux: /proc; otros: pico de getrusage)."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    # ru_maxrss viene en KB en Linux y en bytes en macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / (1024.0 * 1024.0) if sys.platform == "darwin" else maxrss / 1024.0
+
+
+def process_cpu_seconds() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def percentile(values, p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * (p / 100.0)
+    lo = int(k)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+# -----------------------------------------------------------------------------
+# 2. ESCENARIOS DE INTERACCIÓN
+# -----------------------------------------------------------------------------
+def build_scenario(rng: random.Random, pasos: int) -> list:
+    """Genera una secuencia de acciones de usuario.
+
+    Acciones:
+        ("slider", valor)          -> un paso del arrastre del slider (rerun)
+        ("input", etiqueta, valor) -> cambio de un number_input (rerun)
+        ("expander",)              -> apertura/cierre de un expander (sin rerun)
+    """
+    scenario = []
+    percent = 100
+    while len(scenario) < pasos:
+        r = rng.random()
+        if r < 0.5:
+            # Un arrastre genera varios reruns consecutivos con valores cercanos
+            destino = rng.randint(0, 200)
+            step = 10 if destino >= percent else -10
+            for v in range(percent + step, destino + step, step):
+                scenario.append(("slider", max(0, min(200, v))))
+            percent = destino
+        elif r < 0.85:
+            label = rng.choice(list(INPUT_RANGES))
+            lo, hi = INPUT_RANGES[label]
+            scenario.append(("input", label, round(rng.uniform(lo, hi), 2)))
+        else:
+            scenario.append(("expander",))
+    return scenario[:pasos]
+
+
+def apply_action(at: AppTest, action: tuple) -> bool:
+    """Aplica la acción sobre la app. Devuelve True si dispara un rerun."""
+    kind = action[0]
+    if kind == "slider":
+        at.slider(key=SLIDER_KEY).set_value(action[1])
+        return True
+    if kind == "input":
+        for widget in at.number_input:
+            if widget.label == action[1]:
+                widget.set_value(action[2])
+                return True
+        return False
+    return False
+
+
+# -----------------------------------------------------------------------------
+# 3. EJECUCIÓN DE SESIONES
+# -----------------------------------------------------------------------------
+def run_session(session_id: int, pasos: int, seed: int, timeout: float) -> dict:
+    rng = random.Random(seed + session_id)
+    latencias = []
+    errores = 0
+
+    at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+    t0 = time.perf_counter()
+    at.run()
+    primer_render = time.perf_counter() - t0
+    if at.exception:
+        errores += 1
+
+    for action in build_scenario(rng, pasos):
+        if not apply_action(at, action):
+            continue
+        t0 = time.perf_counter()
+        at.run()
+        latencias.append(time.perf_counter() - t0)
+        if at.exception:
+            errores += 1
+
+    return {"sesion": session_id, "primer_render": primer_render,
+            "latencias": latencias, "errores": errores}
+
+
+def warm_up(timeout: float):
+    """Sesión de calentamiento: imports y cachés por proceso, fuera de la medición."""
+    at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+    at.run()
+    at.slider(key=SLIDER_KEY).set_value(150)
+    at.run()
+
+
+def run_load_test(sesiones: int, concurrencia: int, pasos: int, seed: int, timeout: float) -> dict:
+    warm_up(timeout)
+    rss_inicial = current_rss_mb()
+    cpu_inicial = process_cpu_seconds()
+    rss_pico = rss_inicial
+    stop = threading.Event()
+
+    def sample_rss():
+        nonlocal rss_pico
+        while not stop.wait(0.25):
+            rss_pico = max(rss_pico, current_rss_mb())
+
+    sampler = threading.Thread(target=sample_rss, daemon=True)
+    sampler.start()
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrencia) as pool:
+        resultados = list(pool.map(
+            lambda i: run_session(i, pasos, seed, timeout), range(sesiones)
+        ))
+    duracion = time.perf_counter() - t0
+
+    stop.set()
+    sampler.join()
+    rss_final = current_rss_mb()
+    cpu_total = process_cpu_seconds() - cpu_inicial
+
+    latencias = [lat for r in resultados for lat in r["latencias"]]
+    primeros = [r["primer_render"] for r in resultados]
+    reruns = len(latencias) + len(primeros)
+
+    return {
+        "sesiones": sesiones,
+        "concurrencia": concurrencia,
+        "pasos_por_sesion": pasos,
+        "reruns": reruns,
+        "errores": sum(r["errores"] for r in resultados),
+        "duracion_s": duracion,
+        "reruns_por_s": reruns / duracion if duracion > 0 else 0.0,
+        "latencia_ms": {
+            "p50": percentile(latencias, 50) * 1000,
+            "p90": percentile(latencias, 90) * 1000,
+            "p95": percentile(latencias, 95) * 1000,
+            "p99": percentile(latencias, 99) * 1000,
+            "max": max(latencias, default=0.0) * 1000,
+            "media": (statistics.fmean(latencias) * 1000) if latencias else 0.0,
+        },
+        "primer_render_ms": {
+            "p50": percentile(primeros, 50) * 1000,
+            "p95": percentile(primeros, 95) * 1000,
+        },
+        "rss_mb": {
+            "inicial": rss_inicial,
+            "final": rss_final,
+            "pico": max(rss_pico, rss_final),
+            "crecimiento": rss_final - rss_inicial,
+            "crecimiento_por_sesion": (rss_final - rss_inicial) / sesiones,
+        },
+        "cpu_s": {
+            "total": cpu_total,
+            "por_sesion": cpu_total / sesiones,
+            "por_rerun": cpu_total / reruns if reruns else 0.0,
+        },
+    }
+
+
+def print_report(r: dict):
+    lat = r["latencia_ms"]
+    rss = r["rss_mb"]
+    cpu = r["cpu_s"]
+    print(f"Sesiones: {r['sesiones']} (concurrencia {r['concurrencia']}, {r['pasos_por_sesion']} pasos c/u)")
+    print(f"Reruns: {r['reruns']} en {r['duracion_s']:.1f} s -> {r['reruns_por_s']:.2f} reruns/s, errores: {r['errores']}")
+    print(f"Latencia rerun (ms): p50 {lat['p50']:.1f} | p90 {lat['p90']:.1f} | p95 {lat['p95']:.1f} | "
+          f"p99 {lat['p99']:.1f} | max {lat['max']:.1f}")
+    print(f"Primer render (ms): p50 {r['primer_render_ms']['p50']:.1f} | p95 {r['primer_render_ms']['p95']:.1f}")
+    print(f"RSS (MB, después del calentamiento): inicial {rss['inicial']:.1f} | final {rss['final']:.1f} | pico {rss['pico']:.1f} | "
+          f"crecimiento {rss['crecimiento']:.1f} ({rss['crecimiento_por_sesion']:.2f}/sesión)")
+    print(f"CPU (s): total {cpu['total']:.2f} | promedio por sesión {cpu['por_sesion']:.3f} | "
+          f"promedio por rerun {cpu['por_rerun'] * 1000:.1f} ms (total / sesiones, total / reruns)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga del simulador AGPE.")
+    parser.add_argument("--sesiones", type=int, default=10, help="Número de sesiones simuladas")
+    parser.add_argument("--concurrencia", type=int, default=4, help="Sesiones ejecutándose a la vez")
+    parser.add_argument("--pasos", type=int, default=10, help="Interacciones por sesión")
+    parser.add_argument("--seed", type=int, default=1234, help="Semilla para reproducir los escenarios")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Timeout por rerun (s)")
+    parser.add_argument("--json", help="Guardar el reporte en este archivo JSON")
+    args = parser.parse_args()
+
+    resultado = run_load_test(args.sesiones, args.concurrencia, args.pasos, args.seed, args.timeout)
+    print_report(resultado)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(resultado, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
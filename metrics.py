@@ -0,0 +1,339 @@
+"""
+Métricas del servidor: contadores e histogramas de latencia en memoria.
+
+Un registro por proceso, compartido por todas las sesiones de Streamlit, con:
+
+* reruns del script y su latencia,
+* tiempo por etapa de cálculo / renderizado (`timed`),
+* solicitudes y fallos de las cachés de Streamlit (tasa de aciertos),
+* tamaño en bytes de las figuras de Plotly enviadas al navegador (muestreado),
+* arranque en frío: tiempo desde el inicio del proceso hasta el primer render.
+
+Se expone en formato de texto de Prometheus en un endpoint HTTP local y se
+escribe periódicamente en un archivo rotativo (una línea JSON por instantánea).
+
+Variables de entorno:
+    AGPE_METRICS_PORT      puerto del endpoint (por defecto 9464; 0 lo desactiva)
+    AGPE_METRICS_FILE      archivo rotativo (por defecto <tmp>/agpe_metrics.log; vacío lo desactiva)
+    AGPE_METRICS_INTERVAL  segundos entre instantáneas en el archivo (por defecto 60)
+    AGPE_METRICS_PAYLOAD_SAMPLE  fracción de figuras cuyo tamaño se mide (por defecto 0.05)
+"""
+import bisect
+import functools
+import json
+import logging
+import logging.handlers
+import os
+import random
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Buckets de latencia en segundos y de tamaño en bytes
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BYTES_BUCKETS = (1e3, 1e4, 5e4, 1e5, 2.5e5, 5e5, 1e6, 2.5e6, 5e6, 1e7)
+PAYLOAD_SAMPLE_RATE = float(os.environ.get("AGPE_METRICS_PAYLOAD_SAMPLE", "0.05"))
+
+_log = logging.getLogger(__name__)
+_T_IMPORT = time.time()
+
+
+def process_start_time() -> float:
+    """Hora (epoch) en que arrancó el proceso; si no hay /proc, la de importación de este módulo."""
+    try:
+        with open("/proc/self/stat") as f:
+            # El nombre del ejecutable puede tener espacios: los campos van después del último ")"
+            inicio_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return time.time() - uptime + inicio_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return _T_IMPORT
+
+
+class Counter:
+    def __init__(self):
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self) -> float:
+        return self._value
+
+
+class Gauge(Counter):
+    def set(self, value: float):
+        with self._lock:
+            self._value = value
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)   # el último es +Inf
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[i] += 1
+            self._sum += value
+            self._count += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counts, total, count = list(self._counts), self._sum, self._count
+        acumulado, cumulative = 0, []
+        for c in counts:
+            acumulado += c
+            cumulative.append(acumulado)
+        return {"buckets": cumulative, "sum": total, "count": count}
+
+
+class Registry:
+    """Métricas identificadas por nombre + etiquetas; se crean al primer uso."""
+
+    _TYPES = {Counter: "counter", Gauge: "gauge", Histogram: "histogram"}
+
+    def __init__(self):
+        self._metrics = {}      # nombre -> (tipo, ayuda, {etiquetas: métrica})
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name: str, help: str, labels: dict, **kwargs):
+        key = tuple(sorted(labels.items()))
+        family = self._metrics.get(name)
+        if family is not None and key in family[2]:
+            return family[2][key]
+        with self._lock:
+            family = self._metrics.setdefault(name, (cls, help, {}))
+            if family[0] is not cls:
+                raise ValueError(f"La métrica {name} ya está registrada como {self._TYPES[family[0]]}")
+            return family[2].setdefault(key, cls(**kwargs))
+
+    def counter(self, name: str, help: str = "", **labels) -> Counter:
+        return self._get(Counter, name, help, labels)
+
+    def gauge(self, name: str, help: str = "", **labels) -> Gauge:
+        return self._get(Gauge, name, help, labels)
+
+    def histogram(self, name: str, help: str = "", buckets=LATENCY_BUCKETS, **labels) -> Histogram:
+        return self._get(Histogram, name, help, labels, buckets=buckets)
+
+    def render_prometheus(self) -> str:
+        """Formato de exposición de texto de Prometheus (0.0.4)."""
+        lines = []
+        with self._lock:
+            families = sorted((name, cls, help, dict(children)) for name, (cls, help, children) in self._metrics.items())
+        for name, cls, help, children in families:
+            if help:
+                lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {self._TYPES[cls]}")
+            for key, metric in sorted(children.items()):
+                if cls is Histogram:
+                    snap = metric.snapshot()
+                    for le, acumulado in zip(list(metric.buckets) + ["+Inf"], snap["buckets"]):
+                        lines.append(f"{name}_bucket{_labels(key + (('le', _fmt(le)),))} {acumulado}")
+                    lines.append(f"{name}_sum{_labels(key)} {_fmt(snap['sum'])}")
+                    lines.append(f"{name}_count{_labels(key)} {snap['count']}")
+                else:
+                    lines.append(f"{name}{_labels(key)} {_fmt(metric.value)}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> dict:
+        """Instantánea serializable a JSON (usada en el archivo rotativo)."""
+        with self._lock:
+            families = {name: (cls, dict(children)) for name, (cls, _, children) in self._metrics.items()}
+        data = {}
+        for name, (cls, children) in families.items():
+            for key, metric in children.items():
+                etiqueta = name + _labels(key)
+                if cls is Histogram:
+                    snap = metric.snapshot()
+                    data[etiqueta] = {"sum": snap["sum"], "count": snap["count"]}
+                else:
+                    data[etiqueta] = metric.value
+        return data
+
+
+def _fmt(value) -> str:
+    if isinstance(value, str):
+        return value
+    value = float(value)
+    return str(int(value)) if value.is_integer() and abs(value) < 1e15 else repr(value)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(key: tuple) -> str:
+    if not key:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in key) + "}"
+
+
+REGISTRY = Registry()
+
+
+# -----------------------------------------------------------------------------
+# INSTRUMENTACIÓN
+# -----------------------------------------------------------------------------
+@contextmanager
+def timed(stage: str):
+    """Mide el tiempo de una etapa en `agpe_stage_seconds{stage=...}`."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        REGISTRY.histogram("agpe_stage_seconds", "Tiempo por etapa de cálculo o renderizado", stage=stage).observe(
+            time.perf_counter() - t0
+        )
+
+
+def timed_stage(stage: str):
+    """Versión decorador de `timed`."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timed(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def tracked_cache(cache_decorator, name: str):
+    """Envuelve un decorador de caché de Streamlit contando solicitudes y fallos.
+
+    La función original solo se ejecuta en un fallo de caché, así que
+    aciertos = solicitudes - fallos.
+    """
+    requests = REGISTRY.counter("agpe_cache_requests_total", "Llamadas a funciones en caché", cache=name)
+    misses = REGISTRY.counter("agpe_cache_misses_total", "Fallos de caché (se ejecutó la función)", cache=name)
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        def on_miss(*args, **kwargs):
+            misses.inc()
+            return fn(*args, **kwargs)
+
+        cached = cache_decorator(on_miss)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            requests.inc()
+            return cached(*args, **kwargs)
+
+        wrapper.clear = getattr(cached, "clear", None)
+        return wrapper
+    return decorator
+
+
+_first_rerun_done = False
+
+
+@contextmanager
+def timed_rerun(t0: float = None):
+    """Cuenta un rerun completo del script y su latencia.
+
+    `t0` (`time.perf_counter()`) permite medir desde la primera línea del script,
+    incluyendo sus imports. El primer rerun del proceso registra además el
+    arranque en frío (`agpe_cold_start_seconds`, desde que inició el proceso).
+
+    Las excepciones de control de Streamlit (`st.rerun`, `st.stop`) derivan de
+    `BaseException` y no se cuentan como errores.
+    """
+    global _first_rerun_done
+    REGISTRY.counter("agpe_reruns_total", "Reruns del script").inc()
+    t0 = time.perf_counter() if t0 is None else t0
+    try:
+        yield
+    except Exception:
+        REGISTRY.counter("agpe_rerun_errors_total", "Reruns que terminaron en excepción").inc()
+        raise
+    finally:
+        duracion = time.perf_counter() - t0
+        REGISTRY.histogram("agpe_rerun_seconds", "Latencia de un rerun completo").observe(duracion)
+        if not _first_rerun_done:
+            _first_rerun_done = True
+            arranque = time.time() - process_start_time()
+            REGISTRY.gauge("agpe_first_rerun_seconds", "Duración del primer rerun del proceso").set(duracion)
+            REGISTRY.gauge("agpe_cold_start_seconds", "Tiempo desde el inicio del proceso hasta el primer render").set(arranque)
+            _log.info("Primer render en %.3f s (%.3f s desde el inicio del proceso)", duracion, arranque)
+
+
+def sample_payload() -> bool:
+    """Serializar una figura para medirla cuesta milisegundos: solo se mide una fracción."""
+    return random.random() < PAYLOAD_SAMPLE_RATE
+
+
+def observe_payload(figure: str, nbytes: int):
+    REGISTRY.histogram("agpe_figure_payload_bytes", "Tamaño de la figura de Plotly enviada al navegador",
+                       buckets=BYTES_BUCKETS, figure=figure).observe(nbytes)
+
+
+# -----------------------------------------------------------------------------
+# EXPORTADORES
+# -----------------------------------------------------------------------------
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = REGISTRY.render_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _write_snapshots(logger: logging.Logger, interval: float):
+    while True:
+        time.sleep(interval)
+        logger.info(json.dumps({"ts": time.time(), "metrics": REGISTRY.snapshot()}))
+
+
+_started = False
+_start_lock = threading.Lock()
+
+
+def start_exporters():
+    """Inicia (una sola vez por proceso) el endpoint HTTP y el archivo rotativo."""
+    global _started
+    if _started:
+        return
+    with _start_lock:
+        if _started:
+            return
+        _started = True
+
+        port = int(os.environ.get("AGPE_METRICS_PORT", "9464"))
+        if port:
+            try:
+                server = ThreadingHTTPServer(("127.0.0.1", port), _Handler)
+                threading.Thread(target=server.serve_forever, name="agpe-metrics-http", daemon=True).start()
+            except OSError as exc:
+                _log.warning("No se pudo abrir el endpoint de métricas en el puerto %s: %s", port, exc)
+
+        path = os.environ.get("AGPE_METRICS_FILE", os.path.join(tempfile.gettempdir(), "agpe_metrics.log"))
+        if path:
+            logger = logging.getLogger("agpe.metrics.file")
+            logger.propagate = False
+            logger.setLevel(logging.INFO)
+            handler = logging.handlers.RotatingFileHandler(path, maxBytes=5 * 1024 * 1024, backupCount=3)
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            logger.addHandler(handler)
+            interval = float(os.environ.get("AGPE_METRICS_INTERVAL", "60"))
+            threading.Thread(target=_write_snapshots, args=(logger, interval),
+                             name="agpe-metrics-file", daemon=True).start()
@@ -1,345 +1,97 @@
+import time
+_T_INICIO_SCRIPT = time.perf_counter()
+
 import streamlit as st
 import pandas as pd
 import numpy as np
 import plotly.graph_objects as go
-from PIL import Image
 import os
-import base64
+import uuid
+import hashlib
+
+from calculos import (
+    LATITUD_REF, MESES, hourly_consumption_profile, multi_array_generation_profile,
+    settle_hourly, billing, monthly_energy, monthly_ledger, calculate_irr, calculate_npv, simulate_portfolio,
+    FACTOR_EMISION_SIN, FACTORES_EMISION_PATH, co2_avoided_monthly, load_emission_factors,
+)
+from estaciones import ESTACIONES_PATH, load_stations, seasonal_factors
+from jobs import get_job_manager
+from tarifas import TARIFAS_PATH, TARIFF_COLUMNS, load_tariffs, resolve_tariffs
+from metrics import observe_payload, sample_payload, start_exporters, timed, timed_rerun, timed_stage, tracked_cache
+from export import (
+    HORAS_ANIO, SETTLEMENT_KEYS, annual_record_batches, hourly_columns, record_batches,
+    to_bytes, write_arrow, write_parquet,
+)
 # ... imports ...
-try:
-    import numpy_financial as npf
-except ImportError:
-    npf = None
-
-def calculate_irr(values):
-    """Calcula la Tasa Interna de Retorno (IRR)."""
-    if npf:
-        return npf.irr(values)
-    
-    # Fallback básico si numpy_financial no está instalado (usando numpy < 1.24 si tiene irr, o aproximación)
-    # Numpy 1.24+ eliminó np.irr.
-    try:
-        return np.irr(values)
-    except AttributeError:
-        # Implementación simple de Newton-Raphson para IRR
-        res = 0.1
-        for _ in range(20):
-            npv = 0
-            d_npv = 0
-            for t, val in enumerate(values):
-                npv += val / ((1 + res) ** t)
-                d_npv -= t * val / ((1 + res) ** (t + 1))
-            if abs(d_npv) < 1e-6:
-                return res
-            res = res - npv / d_npv
-            if abs(npv) < 1e-6:
-                return res
-        return res
-
-def calculate_npv(rate, values):
-    """Calcula el Valor Presente Neto (NPV)."""
-    if npf:
-        return npf.npv(rate, values)
-    try:
-        return np.npv(rate, values)
-    except AttributeError:
-        values = np.asarray(values)
-        t = np.arange(len(values))
-        return (values / (1 + rate) ** t).sum()
-
 # -----------------------------------------------------------------------------
 # 1. CONFIGURACIÓN DE PÁGINA (Debe ser la primera línea de Streamlit)
 # -----------------------------------------------------------------------------
 st.set_page_config(page_title="Simulador AGPE - CREG 174 (2021)", layout="wide")
 
+# Endpoint Prometheus local y archivo rotativo de métricas (una vez por proceso)
+start_exporters()
+
 
 
 # -----------------------------------------------------------------------------
 # 2. ESTILOS CSS
 # -----------------------------------------------------------------------------
+@tracked_cache(st.cache_resource(show_spinner=False), "estilos")
+def load_style_bundle() -> dict:
+    """Hoja de estilos y data URIs precompilados por `build_assets.py`.
 
+    Si el archivo no existe o está desactualizado se arma aquí, una sola vez por proceso.
+    """
+    from build_assets import build_style_bundle, load_bundle
+    bundle = load_bundle()
+    return bundle if bundle is not None else build_style_bundle()
 
-def get_base64_of_bin_file(bin_file):
-    with open(bin_file, 'rb') as f:
-        data = f.read()
-    return base64.b64encode(data).decode()
-
-def get_plotly_uri(path):
-    #Convierte una ruta de archivo en un Data URI para Plotly.
-    if os.path.exists(path):
-        encoded = get_base64_of_bin_file(path)
-        return f"data:image/jpg;base64,{encoded}"
-    return None
-
-
+@timed_stage("apply_custom_styles")
 def apply_custom_styles():
-    # Cargar imagen de fondo del proyecto 
-    #Marcas de Agua para los Graficos en modo fullscreen
-    current_dir = os.path.dirname(__file__)
-    logo_path = os.path.join(current_dir, "assets", "logo ressas 572x197.jpg")  
-    logotxt_path = os.path.join(current_dir, "assets", "Icono ressas.jpg")
-    watermark_path = os.path.join(current_dir, "assets", "Text RESsas.jpg")
-    
-    bin_str_logo = ""
-    bin_str_bg = ""
-    bin_str_watermark = ""
-    # 2. Convertir imagen a base64
-    if os.path.exists(logo_path):
-        bin_str_logo = get_base64_of_bin_file(logo_path)
-    if os.path.exists(logotxt_path):
-        bin_str_bg = get_base64_of_bin_file(logotxt_path)
-    
-    if os.path.exists(watermark_path):
-        bin_str_watermark = get_base64_of_bin_file(watermark_path)  
-
-    uri_fondo = get_plotly_uri(logotxt_path)
-    uri_marca_agua = get_plotly_uri(watermark_path)
-
-
-    st.markdown(f"""
-        <style>
-        /* 1. Capa de fondo ajustada al contenido principal */
-            .stApp::before {{
-                content: "";
-                background-image: url("data:image/jpg;base64,{bin_str_bg}");
-                background-repeat: no-repeat;
-                background-attachment: fixed;
-                background-position: center; /* Centra la imagen dentro de su contenedor */
-                background-size: 40%; /* Tamaño de la marca de agua */
-                
-                position: fixed;
-                top: 0;
-                /* El truco: dejar que el flexbox de Streamlit maneje el margen izquierdo */
-                left: 0; 
-                right: 0;
-                bottom: 0;
-                
-                /* Margen para compensar el sidebar de Streamlit (aprox 21rem o 336px) */
-                margin-left: auto; 
-                margin-right: auto;
-                
-                opacity: 0.08;
-                z-index: -1;
-                pointer-events: none; /* Evita que el fondo interfiera con clicks */
-            }}
-         /* CAPA 2: Logo Inferior Derecha (Usando ::after) */
-            .stApp::after {{
-                content: "";
-                background-image: url("data:image/jpg;base64,{bin_str_logo}");
-                background-repeat: no-repeat;
-                background-position: bottom right;
-                background-size: 200px; /* Ajusta el tamaño deseado */
-                
-                position: fixed;
-                bottom: 20px; /* Margen desde abajo */
-                right: 20px;  /* Margen desde la derecha */
-                width: 200px; /* Debe ser igual o mayor a background-size */
-                height: 100px;
-                
-                opacity: 0.4; /* Un poco más visible que el fondo */
-                z-index: 1;   /* Por encima del fondo central */
-                pointer-events: none;
-            }}
-            
-            /* Ajuste para que el fondo ignore el sidebar visualmente */
-            @media (min-width: 992px) {{
-                .stApp::before {{ margin-left: 336px; }}
-            }}   
-            /* 2. LOGO SOLO EN LOS GRAFICOS*/
-
-            [data-testid="stFullScreenFrame"]::after {{
-                content: "";
-                background-image: url("data:image/jpg;base64,{bin_str_watermark}");
-                background-repeat: no-repeat;
-                background-position: center;
-                background-size: contain;
-                
-                /* Posicionamiento centrado */
-                position: absolute;
-                top: 50%;
-                left: 50%;
-                transform: translate(-50%, -50%);
-                
-                /* Tamaño y Opacidad */
-                width: 50%; 
-                height: 50%;
-                opacity: 0.10; /* Sutil para no estorbar la lectura */
-                
-                z-index: 99; /* Suficiente para estar sobre el gráfico pero bajo los tooltips */
-                pointer-events: none;
-            }}
-
-            /* 2. Aseguramos que el contenedor principal sea transparente */
-            .stApp {{
-                background-color: rgba(0,0,0,0);
-            }}
-        /* Ocultar elementos default
-        
-        header {{visibility: hidden;}} 
-        #MainMenu {{visibility: hidden;}}
-        footer {{visibility: hidden;}}*/
-       
-        
-        /* --- ESTILO PARA MÉTRICAS NORMALES --- */
-        [data-testid="stMetric"] {{
-            background-color: rgba(0,0,0,0); /* Mantener fondo blanco para legibilidad */
-            padding: 15px;
-            border-radius: 10px;
-            border: 1px solid #e2e8f0;
-            box-shadow: 0 2px 5px rgba(0,0,0,0.05);
-        }}
-        
+    # Marcas de agua para el fondo y para los gráficos en modo fullscreen
+    estilos = load_style_bundle()
+    st.markdown(estilos["css"], unsafe_allow_html=True)
+    return estilos["uri_marca_agua"], estilos["uri_fondo"]
 
-        /* --- AJUSTE PARA LOS INPUTS DEL SIDEBAR --- */
-         /* --- ALINEACIÓN HORIZONTAL EN SIDEBAR --- */
-            /* Forzamos al contenedor del widget a ser una fila */
-            [data-testid="stSidebar"] .stNumberInput {{
-                display: flex;
-                flex-direction: row;
-                align-items: center;
-                justify-content: space-between;
-                gap: 10px;
-                margin-bottom: 10px;
-            }}
-
-            /* Ajustamos el label (texto) para que no ocupe todo el ancho */
-            [data-testid="stSidebar"] .stNumberInput label {{
-                display: flex;
-                margin-bottom: 0 !important; /* Quita el espacio de abajo del texto */
-                flex: 1 1 auto;
-                min-width: 150px; /* Asegura espacio para el nombre */
-            }}
-
-            /* Ajustamos el cuadro de entrada de número */
-            [data-testid="stSidebar"] .stNumberInput div[data-baseweb="input"] {{
-                width: 120px !important; /* Ancho fijo para los cuadritos de números */
-                flex: 0 0 auto;
-            }}
-
-            /* Opcional: Hacer la fuente un poco más pequeña para que quepa mejor */
-            [data-testid="stSidebar"] label p {{
-                font-size: 14px !important;
-            }}  
-        /* --- AJUSTE PARA LOS INPUTS DEL SIDEBAR --- */
-            /* --- MOVER LOGO AL FINAL DEL SIDEBAR --- */
-        /* Convertimos el contenedor de widgets del sidebar en un Flexbox vertical */
-        [data-testid="stSidebarUserContent"] {{
-            display: flex;
-            flex-direction: column;
-            height: 90vh; /* Ajusta la altura para que ocupe casi toda la pantalla */
-        }} 
-
-        /* Buscamos el contenedor de la imagen y le damos un margen superior automático */
-        /* Esto empuja la imagen hacia el fondo del contenedor flex */
-        [data-testid="stSidebarUserContent"] .stImage {{
-            margin-top: auto !important;
-            padding-bottom: 20px;
-        }} 
-
-        </style>
-        
-    """, unsafe_allow_html=True)
-    return uri_marca_agua, uri_fondo
-
-apply_custom_styles()
 
 # -----------------------------------------------------------------------------
 # 3. LÓGICA DE CÁLCULO
 # -----------------------------------------------------------------------------
 HOUR_LABELS = [f"{h}:00" for h in range(24)]
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
 
-def hourly_consumption_profile(monthly_consumption_kwh: float) -> np.ndarray:
-    base = monthly_consumption_kwh / 30.0 / 24.0
-    multipliers = np.zeros(24)
-    for h in range(24):
-        if 0 <= h <= 7: multipliers[h] = 0.35
-        elif 8 <= h <= 10: multipliers[h] = 1.15
-        elif 11 <= h <= 16: multipliers[h] = 1.65
-        elif 17 <= h <= 21: multipliers[h] = 1.30
-        elif 22 <= h <= 23: multipliers[h] = 0.55
-    
-    ruido = np.random.uniform(0.8, 1.2, 24)
-    profile = (base * multipliers) * ruido
-    if profile.sum() > 0:
-        scale = (monthly_consumption_kwh / 30.0) / profile.sum()
-        profile = profile * scale
-    return profile
-
-def solar_generation_profile(monthly_consumption_kwh: float, percent_comp: float) -> np.ndarray:
-    hours = np.arange(24)
-    raw = np.sin(np.pi * (hours - 6) / 12.0)
-    raw = np.clip(raw, 0, None)
-    daily_raw_sum = raw.sum()
-    if daily_raw_sum == 0 or percent_comp <= 0:
-        return np.zeros(24)
-    target_monthly_gen = monthly_consumption_kwh * (percent_comp / 100.0)
-    scale = target_monthly_gen / (daily_raw_sum * 30.0)
-    gen = raw * scale
-    return gen
-
-def settle_hourly(demand: np.ndarray, generation: np.ndarray) -> dict:
-    autoconsumo = np.minimum(generation, demand)
-    excedente = np.maximum(generation - demand, 0.0)
-    importada = np.maximum(demand - generation, 0.0)
-    return {
-        "demand": demand, "generation": generation,
-        "autoconsumo": autoconsumo, "excedente": excedente, "importada": importada,
-    }
-
-def billing(monthly_consumption_kwh: float, hourly: dict, CU: float, C: float, precio_bolsa: float, factor_contribucion:float,) -> dict:
-    autoconsumo_mes = hourly["autoconsumo"].sum() * 30.0
-    excedente_total_mes = hourly["excedente"].sum() * 30.0
-    importada_mes = hourly["importada"].sum() * 30.0
-    
-    exc_tipo1 = min(excedente_total_mes, importada_mes)
-    exc_tipo2 = max(0, excedente_total_mes - importada_mes)
-
-    # --- LÓGICA DE CONTRIBUCIÓN CORREGIDA ---
-    # La contribución se cobra sobre los kWh netos (Importados - Compensados T1)
-    kwh_netos_a_pagar = max(0, importada_mes - exc_tipo1)
-    # El valor base es la tarifa CU por esos kWh netos
-    valor_base_contribucion = kwh_netos_a_pagar * CU
-    contribucion = valor_base_contribucion * (factor_contribucion / 100)
-    # ----------------------------------------
-    
-    costo_sin_proyecto = monthly_consumption_kwh * CU*(1+(factor_contribucion/100))
-    
-    valor_importada = importada_mes * CU
-    
-    costo_intercambio_t1 = exc_tipo1 * C
-    credito_t1 = exc_tipo1 * -CU
-    credito_t2 = exc_tipo2 * -precio_bolsa
+@tracked_cache(st.cache_data(show_spinner=False), "factores_emision")
+def load_emission_factor_table(path: str = FACTORES_EMISION_PATH) -> np.ndarray:
+    """Tabla (12, 24) de factores de emisión (ver `calculos.load_emission_factors`), en caché."""
+    return load_emission_factors(path)
 
-    # Ahorro de contribución por Autoconsumo (Energía que no pasó por el medidor)
-    ahorro_contrib_auto = (autoconsumo_mes * CU) * (factor_contribucion / 100)
-    
-    # Ahorro de contribución por Excedentes T1 (Energía compensada 1 a 1)
-    ahorro_contrib_t1 = (exc_tipo1 * CU) * (factor_contribucion / 100)
-    
-    # Total ahorro en contribución
-    total_ahorro_contribucion = ahorro_contrib_auto + ahorro_contrib_t1
-    
-    costo_con_proyecto = valor_importada + contribucion+costo_intercambio_t1 + credito_t1 + credito_t2
-    
-    ahorro_autoconsumo = autoconsumo_mes * CU
-    beneficio_neto_excedentes = abs(credito_t1 + credito_t2) - costo_intercambio_t1
-    
-    return {
-        "autoconsumo_mes": autoconsumo_mes,
-        "importada_mes": importada_mes,
-        "v_contribucion":contribucion,
-        "exc_tipo1": exc_tipo1,
-        "exc_tipo2": exc_tipo2,
-        "costo_sin": costo_sin_proyecto,
-        "costo_con": costo_con_proyecto,
-        "v_importada": valor_importada,
-        "v_intercambio": costo_intercambio_t1,
-        "v_credito_t1": credito_t1,
-        "v_credito_t2": credito_t2,
-        "v_ahorro_auto": ahorro_autoconsumo,
-        "v_ahorro_contribucion": total_ahorro_contribucion,
-        "v_beneficio_exc": beneficio_neto_excedentes
-    }
+@tracked_cache(st.cache_data(show_spinner=False), "precio_bolsa")
+def load_spot_price_profile(path: str = os.path.join(DATA_DIR, "precio_bolsa.csv")) -> np.ndarray:
+    """Perfil mensual del precio de bolsa relativo a su promedio (12 valores, promedio 1).
+
+    Se escala con el precio de bolsa del panel lateral; sin archivo el precio es plano.
+    """
+    factores = np.ones(12)
+    if os.path.exists(path):
+        tabla = pd.read_csv(path)
+        factores[tabla["mes"].to_numpy(dtype=int) - 1] = tabla["precio_cop_kwh"].to_numpy(dtype=float)
+        factores /= factores.mean()
+    return factores
+
+@tracked_cache(st.cache_resource(show_spinner=False), "tarifas")
+def load_tariff_index(path: str = TARIFAS_PATH):
+    """`(indice, tabla)` de tarifas (ver `tarifas.load_tariffs`), una sola vez por proceso."""
+    return load_tariffs(path)
+
+@tracked_cache(st.cache_resource(show_spinner=False), "estaciones")
+def load_station_index(path: str = ESTACIONES_PATH):
+    """Estaciones de HSP con su índice espacial, construido una sola vez por proceso.
+
+    Devuelve None si no está la tabla (la HSP se digita manualmente).
+    """
+    if not os.path.exists(path):
+        return None
+    return load_stations(path)
 
 def render_detailed_billing(bill_data: dict, CU: float, C: float, precio_bolsa: float, hourly_data: dict, consumo_mensual: float):
     st.markdown("## 📊 Como se comporta la Factura de Energia")
@@ -383,6 +135,14 @@ def render_detailed_billing(bill_data: dict, CU: float, C: float, precio_bolsa:
         st.write(f"📉 **Ahorro Contribución (20%):** $ {v_ahorro_impuestos:,.0f}")
         st.markdown(f"### **Total Ahorro Real:** \n# $ {total_beneficio:,.0f}")
 
+def plotly_chart(fig: go.Figure, nombre: str):
+    """`st.plotly_chart` con métricas: tiempo de envío y, por muestreo, tamaño de la figura."""
+    with timed(f"plotly_chart:{nombre}"):
+        st.plotly_chart(fig, use_container_width=True)
+    if sample_payload():
+        observe_payload(nombre, len(fig.to_json()))
+
+@timed_stage("plot_profiles")
 def plot_profiles(df: pd.DataFrame):
     fig = go.Figure()
     fig.add_trace(go.Scatter(x=df["hora"], y=df["consumo_kwh"], name="Consumo (kWh/h)", fill="tozeroy", line=dict(color="firebrick"), opacity=0.6))
@@ -396,8 +156,9 @@ def plot_profiles(df: pd.DataFrame):
     plot_bgcolor='rgba(0,0,0,0)',
     height=450, margin=dict(t=50, b=80, l=50, r=20), hovermode="x unified"
     )
-    st.plotly_chart(fig, use_container_width=True)
+    plotly_chart(fig, "perfiles")
 
+@timed_stage("plot_monthly_comparison")
 def plot_monthly_comparison(df: pd.DataFrame):
     total_consumo = df["consumo_kwh"].sum() * 30
     total_autoconsumo = df["autoconsumo_kwh"].sum() * 30
@@ -419,7 +180,138 @@ def plot_monthly_comparison(df: pd.DataFrame):
         paper_bgcolor='rgba(0,0,0,0)',
         plot_bgcolor='rgba(0,0,0,0)',
     )
-    st.plotly_chart(fig, use_container_width=True)
+    plotly_chart(fig, "mes_tipico")
+
+@timed_stage("plot_monthly_ledger")
+def plot_monthly_ledger(libro: dict, nombre: str):
+    """Energía por periodo (autoconsumo, Tipo 1, Tipo 2) y factura con proyecto."""
+    fig = go.Figure()
+    if "autoconsumo_mes" in libro:
+        fig.add_trace(go.Bar(x=MESES, y=libro["autoconsumo_mes"], name="Autoconsumo", marker_color='#22C55E'))
+    fig.add_trace(go.Bar(x=MESES, y=libro["exc_tipo1"], name="Excedente Tipo 1", marker_color='goldenrod'))
+    fig.add_trace(go.Bar(x=MESES, y=libro["exc_tipo2"], name="Excedente Tipo 2", marker_color='#F59E0B'))
+    fig.add_trace(go.Scatter(x=MESES, y=libro["costo_con"], name="Factura con Proyecto (COP)", yaxis="y2",
+                             mode="lines+markers", line=dict(color="#3B82F6", width=3)))
+    fig.update_layout(
+        barmode='stack', bargap=0.2,
+        title=dict(text="Liquidación por Periodo CREG 174", x=0.5, y=0.05, xanchor='center', yanchor='top'),
+        yaxis=dict(title="kWh por mes"), yaxis2=dict(title="COP", overlaying="y", side="right", showgrid=False),
+        height=450, margin=dict(t=50, b=80, l=50, r=50), hovermode="x unified",
+        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1),
+        paper_bgcolor='rgba(0,0,0,0)',
+        plot_bgcolor='rgba(0,0,0,0)',
+    )
+    plotly_chart(fig, nombre)
+
+def render_monthly_ledger(libro: dict, bill: dict, precio_bolsa_mensual: np.ndarray):
+    with st.expander("📅 Liquidación Mensual CREG 174 (12 periodos)"):
+        st.caption("Los excedentes se clasifican en Tipo 1 y Tipo 2 en cada periodo de facturación. "
+                   "La estacionalidad de la irradiancia de la estación y del precio de bolsa mueve energía "
+                   "entre ambos tipos frente al mes típico.")
+        ahorro_tipico = bill["costo_sin"] - bill["costo_con"]
+        l1, l2, l3 = st.columns(3)
+        l1.metric("Excedentes Tipo 1 / Año", f"{libro['exc_tipo1_anual']:,.0f} kWh",
+                  delta=f"{libro['exc_tipo1_anual'] - bill['exc_tipo1'] * 12:+,.0f} kWh vs mes típico", delta_color="off")
+        l2.metric("Excedentes Tipo 2 / Año", f"{libro['exc_tipo2_anual']:,.0f} kWh",
+                  delta=f"{libro['exc_tipo2_anual'] - bill['exc_tipo2'] * 12:+,.0f} kWh vs mes típico", delta_color="off")
+        l3.metric("Ahorro Anual (12 periodos)", f"$ {libro['ahorro_anual']:,.0f}",
+                  delta=f"{libro['ahorro_anual'] - ahorro_tipico * 12:+,.0f} COP vs mes típico", delta_color="off")
+
+        tabla = pd.DataFrame({
+            "Mes": MESES,
+            "Generación (kWh)": libro["generacion_mes"],
+            "Autoconsumo (kWh)": libro["autoconsumo_mes"],
+            "Exc. Tipo 1 (kWh)": libro["exc_tipo1"],
+            "Exc. Tipo 2 (kWh)": libro["exc_tipo2"],
+            "Precio Bolsa (COP/kWh)": precio_bolsa_mensual,
+            "Crédito T1 ($)": np.abs(libro["v_credito_t1"]),
+            "Venta T2 ($)": np.abs(libro["v_credito_t2"]),
+            "Contribución ($)": libro["v_contribucion"],
+            "Comercialización T1 ($)": libro["v_intercambio"],
+            "Factura con Proyecto ($)": libro["costo_con"],
+            "Ahorro ($)": libro["ahorro"],
+        })
+        st.dataframe(tabla.style.format("{:,.0f}", subset=tabla.columns[1:]), use_container_width=True, hide_index=True)
+        plot_monthly_ledger(libro, "libro_mensual")
+
+@st.fragment(run_every=1.0)
+def poll_job(job_id: str, texto: str):
+    """Muestra el avance de un trabajo en segundo plano sin bloquear el script.
+
+    Solo este fragmento se re-ejecuta cada segundo; al terminar el trabajo se
+    recarga la app completa para mostrar el resultado.
+    """
+    estado = get_job_manager().status(job_id)
+    if estado["estado"] in ("pendiente", "ejecutando"):
+        st.progress(estado["progreso"], text=f"{texto} {estado['progreso'] * 100:.0f}%")
+    else:
+        st.rerun()
+
+@tracked_cache(st.cache_resource(show_spinner=False, max_entries=4), "exportacion_portafolio")
+def portfolio_export(job_id: str, hash_clientes: str, _columnas: dict, anual: bool = False) -> bytes:
+    """Parquet del portafolio (una fila por cliente), en caché por trabajo.
+
+    La caché se comparte entre sesiones: `hash_clientes` (nombres de los clientes,
+    que no forman parte del hash del trabajo) evita servir el archivo de otra carga
+    con los mismos números. Es una caché de recursos porque `st.cache_data` copia los
+    bytes en cada acierto (~100 MB por rerun en un portafolio grande). El día típico
+    se escribe sobre los arreglos del resultado sin copiarlos; el año (8760 h) se
+    arma lote por lote mientras se escribe.
+    """
+    columnas_cliente = {k: v for k, v in _columnas.items() if np.ndim(v) == 1}
+    if anual:
+        return to_bytes(write_parquet, annual_record_batches(_columnas, columnas_cliente))
+    return to_bytes(write_parquet, record_batches(_columnas))
+
+def render_portfolio_job(job_id: str, clientes: pd.DataFrame):
+    estado = get_job_manager().status(job_id)
+    if estado["estado"] in ("pendiente", "ejecutando"):
+        poll_job(job_id, "Simulando portafolio...")
+        return
+    if estado["estado"] == "error":
+        st.error(f"La simulación del portafolio falló: {estado['error']}")
+        return
+    if estado["estado"] == "cancelado":
+        st.info("La simulación fue reemplazada por una más reciente.")
+        return
+
+    r = estado["resultado"]
+    p1, p2, p3, p4 = st.columns(4)
+    p1.metric("Clientes Simulados", f"{len(clientes):,}")
+    p2.metric("Capacidad Total", f"{r['kwp'].sum():,.1f} kWp")
+    p3.metric("Ahorro Mensual Portafolio", f"$ {r['ahorro'].sum():,.0f} COP")
+    p4.metric("Ahorro Anual (12 periodos)", f"$ {r['ahorro_anual'].sum():,.0f} COP")
+    resumen = clientes.assign(kwp=r["kwp"], costo_con=r["costo_con"], ahorro=r["ahorro"], ahorro_anual=r["ahorro_anual"],
+                              exc_tipo2_anual=r["exc_tipo2_periodos"].sum(axis=1))
+    st.dataframe(resumen, use_container_width=True)
+    # Libro del portafolio: suma de los N x 12 periodos por mes
+    plot_monthly_ledger({"exc_tipo1": r["exc_tipo1_periodos"].sum(axis=0),
+                         "exc_tipo2": r["exc_tipo2_periodos"].sum(axis=0), "costo_con": r["costo_con_periodos"].sum(axis=0)},
+                        "libro_portafolio")
+
+    columnas = {"cliente": clientes["cliente"].astype(str).to_numpy() if "cliente" in clientes else np.arange(len(clientes)),
+                **{k: r[k] for k in ("kwp", "costo_sin", "costo_con", "ahorro", "exc_tipo1", "exc_tipo2", "ahorro_anual")},
+                **{k: r[k] for k in ("exc_tipo1_periodos", "exc_tipo2_periodos", "costo_con_periodos")},
+                **{k: r[k] for k in SETTLEMENT_KEYS}}
+    hash_clientes = hashlib.sha256("\x1f".join(map(str, columnas["cliente"])).encode()).hexdigest()
+    e1, e2 = st.columns(2)
+    # Los archivos se arman cuando se piden, no en cada render de la página
+    if e1.button("Preparar Parquet portafolio (día típico)", key="preparar_portafolio"):
+        st.session_state["exportacion_portafolio"] = (job_id, hash_clientes)
+    if st.session_state.get("exportacion_portafolio") == (job_id, hash_clientes):
+        with st.spinner("Generando el día típico..."):
+            datos = portfolio_export(job_id, hash_clientes, columnas)
+        e1.download_button("⬇️ Parquet portafolio (día típico)", datos,
+                           file_name="portafolio_horario.parquet", mime="application/octet-stream")
+    # El año completo crece 365 veces: solo se ofrece en línea para portafolios pequeños
+    if len(clientes) * HORAS_ANIO * len(SETTLEMENT_KEYS) * 8 <= 200 * 1024 ** 2:
+        if e2.button("Preparar Parquet portafolio (8760 h)", key="preparar_anual_portafolio"):
+            st.session_state["exportacion_anual"] = (job_id, hash_clientes)
+        if st.session_state.get("exportacion_anual") == (job_id, hash_clientes):
+            with st.spinner("Generando el año completo..."):
+                datos = portfolio_export(job_id, hash_clientes, columnas, anual=True)
+            e2.download_button("⬇️ Parquet portafolio (8760 h)", datos,
+                               file_name="portafolio_anual.parquet", mime="application/octet-stream")
 
 # -----------------------------------------------------------------------------
 # 4. FUNCIÓN MAIN
@@ -436,11 +328,53 @@ def main():
     with st.sidebar:
         st.header("Parámetros de Simulación")
         consumo = st.number_input("Consumo mensual (kWh)", min_value=0.0, value=1200.0, format="%.2f")
-        CU = st.number_input("Tarifa CU (COP/kWh)", min_value=0.0, value=720.0)
-        factor_contribucion= st.number_input("Contribucion (%/kWh)", min_value=0.0, value=20.0)
-        C = st.number_input("Comercialización C (COP/kWh)", min_value=0.0, value=56.71)
+
+        # Tarifa: consulta en la tabla del operador de red o digitación manual
+        indice_tarifas, tabla_tarifas = load_tariff_index()
+        operadores = tabla_tarifas.index.unique("operador").tolist()
+        operador = st.selectbox("Operador de red", ["Manual"] + operadores)
+        tarifa = (720.0, 56.71, 20.0)
+        clave_tarifa = "manual"
+        if operador != "Manual":
+            opciones = tabla_tarifas.loc[operador].index
+            nivel = st.selectbox("Nivel de tensión", opciones.unique("nivel").tolist())
+            estrato = st.selectbox("Estrato / Uso", opciones[opciones.get_level_values("nivel") == nivel].unique("estrato").tolist())
+            mes_tarifa = st.selectbox("Mes de la tarifa", sorted(opciones.unique("mes").tolist(), reverse=True))
+            clave = (operador, nivel, estrato, mes_tarifa)
+            if clave in indice_tarifas:
+                tarifa = indice_tarifas[clave]
+                clave_tarifa = "|".join(map(str, clave))
+            else:
+                st.warning("No hay tarifa publicada para esa combinación; ingrésela manualmente.")
+        # La clave del widget cambia con la tarifa consultada para que el valor se actualice
+        CU = st.number_input("Tarifa CU (COP/kWh)", min_value=0.0, value=float(tarifa[0]), key=f"cu_{clave_tarifa}")
+        factor_contribucion= st.number_input("Contribucion (%/kWh)", min_value=0.0, value=float(tarifa[2]), key=f"contrib_{clave_tarifa}")
+        C = st.number_input("Comercialización C (COP/kWh)", min_value=0.0, value=float(tarifa[1]), key=f"c_{clave_tarifa}")
         precio_bolsa = st.number_input("Precio de Bolsa (COP/kWh)", min_value=0.0, value=210.0)
-        hsp=st.number_input("Horas Solar Pico", min_value=0.0, value=3.5)
+
+        # Ubicación: HSP e irradiancia mensual de la estación más cercana (o digitación manual)
+        estaciones = load_station_index()
+        modos_ubicacion = ["Municipio", "Coordenadas", "Manual"] if estaciones is not None else ["Manual"]
+        modo_ubicacion = st.radio("Ubicación del proyecto", modos_ubicacion, horizontal=True, key="modo_ubicacion")
+        estacion = None
+        latitud_sitio = LATITUD_REF
+        if modo_ubicacion == "Municipio":
+            municipios = sorted(estaciones.etiquetas)
+            etiqueta = st.selectbox("Municipio", municipios, index=municipios.index("Bogotá D.C.") if "Bogotá D.C." in municipios else 0)
+            estacion = estaciones.by_label(etiqueta)
+            latitud_sitio = estacion["latitud"]
+        elif modo_ubicacion == "Coordenadas":
+            col_lat_sitio, col_lon_sitio = st.columns(2)
+            latitud_sitio = col_lat_sitio.number_input("Latitud (°)", min_value=-5.0, max_value=14.0, value=4.711, format="%.4f")
+            longitud_sitio = col_lon_sitio.number_input("Longitud (°)", min_value=-82.0, max_value=-66.0, value=-74.072, format="%.4f")
+            estacion = estaciones.lookup(latitud_sitio, longitud_sitio)
+            st.caption(f"Estación más cercana: {estacion['etiqueta']} a {estacion['distancia_km']:,.1f} km")
+        clave_hsp = estacion["etiqueta"] if estacion else "manual"
+        hsp=st.number_input("Horas Solar Pico", min_value=0.0, value=estacion["hsp"] if estacion else 3.5, key=f"hsp_{clave_hsp}")
+        if estacion:
+            irradiancia = estacion["irradiancia"]
+            st.caption(f"HSP mensual entre {irradiancia.min():.2f} (mes {irradiancia.argmin() + 1}) "
+                       f"y {irradiancia.max():.2f} (mes {irradiancia.argmax() + 1}).")
         
         st.header("Ajustes de Compensación")
         percent = st.slider("Porcentaje de compensación solar (%)", 0, 200, 100, key='percent_slider_sidebar')
@@ -472,11 +406,53 @@ def main():
     with c3:
         st.metric("Generación Objetivo", f"{gen_obj:,.0f} kWh/mes")
 
-   
-    demand = hourly_consumption_profile(consumo)
-    generation = solar_generation_profile(consumo, percent)
-    hourly = settle_hourly(demand, generation)
-    bill = billing(consumo, hourly, CU, C, precio_bolsa, factor_contribucion)
+
+    # Arreglos FV: orientaciones, inclinaciones e inversor compartido
+    expander_fv = st.expander("☀️ Configuración de Arreglos FV")
+    with expander_fv:
+        st.caption("Distribuya el kWp del proyecto entre sub-arreglos con distinta orientación. "
+                   "Azimut en grados desde el norte (90 = oriente, 180 = sur, 270 = occidente).")
+        arreglos = st.data_editor(
+            pd.DataFrame({"arreglo": ["Principal"], "porcentaje_kwp": [100.0], "azimut": [180.0], "inclinacion": [10.0]}),
+            num_rows="dynamic", use_container_width=True, key="arreglos_fv",
+            column_config={
+                "arreglo": st.column_config.TextColumn("Arreglo"),
+                "porcentaje_kwp": st.column_config.NumberColumn("% del kWp", min_value=0.0, max_value=100.0),
+                "azimut": st.column_config.NumberColumn("Azimut (°)", min_value=0.0, max_value=360.0),
+                "inclinacion": st.column_config.NumberColumn("Inclinación (°)", min_value=0.0, max_value=90.0),
+            },
+        )
+        col_inv, col_lat = st.columns(2)
+        relacion_dc_ac = col_inv.number_input("Relación DC/AC del inversor", min_value=0.5, value=1.2, step=0.05)
+        latitud = col_lat.number_input("Latitud del proyecto (°)", min_value=-5.0, max_value=14.0, value=float(latitud_sitio),
+                                       key=f"latitud_fv_{latitud_sitio}")
+
+    arreglos = arreglos.dropna(subset=["porcentaje_kwp", "azimut", "inclinacion"])
+    arreglos = arreglos[arreglos["porcentaje_kwp"] > 0]
+    with timed("perfil_generacion"):
+        fv = multi_array_generation_profile(
+            kWp, hsp, arreglos["porcentaje_kwp"].to_numpy(), arreglos["azimut"].to_numpy(),
+            arreglos["inclinacion"].to_numpy(), relacion_dc_ac, latitud,
+        )
+    recorte_mes = fv["recorte"].sum() * 30.0
+    generacion_dc_mes = fv["dc"].sum() * 30.0
+    with expander_fv:
+        m_dc, m_ac, m_rec = st.columns(3)
+        m_dc.metric("Generación DC", f"{generacion_dc_mes:,.0f} kWh/mes")
+        m_ac.metric("Generación AC", f"{fv['ac'].sum() * 30.0:,.0f} kWh/mes")
+        m_rec.metric("Recorte Inversor", f"{recorte_mes:,.0f} kWh/mes",
+                     help="Energía DC que el inversor no puede entregar, estimada hora a hora sobre el día típico.")
+    if recorte_mes > 0:
+        st.warning(f"El inversor recorta {recorte_mes:,.0f} kWh/mes "
+                   f"({recorte_mes / generacion_dc_mes * 100:.1f}% de la generación DC). "
+                   "Considere una relación DC/AC menor.")
+
+    with timed("perfil_consumo"):
+        demand = hourly_consumption_profile(consumo)
+    generation = fv["ac"]
+    with timed("liquidacion"):
+        hourly = settle_hourly(demand, generation)
+        bill = billing(consumo, hourly, CU, C, precio_bolsa, factor_contribucion)
     
     df = pd.DataFrame({
         "hora": HOUR_LABELS, "consumo_kwh": hourly["demand"],
@@ -494,6 +470,18 @@ def main():
             "importada_kwh": "{:.3f}",
         }), use_container_width=True)
 
+        # Exportación columnar construida sobre los mismos arreglos NumPy (sin copias).
+        # Se prepara solo a pedido: los botones necesitan los bytes en cada rerun y
+        # el primer export carga pyarrow.parquet.
+        if st.toggle("Preparar descargas (Parquet / Arrow)", key="preparar_descargas"):
+            d1, d2, d3 = st.columns(3)
+            d1.download_button("⬇️ Parquet (día típico)", to_bytes(write_parquet, record_batches(hourly_columns(hourly))),
+                               file_name="liquidacion_horaria.parquet", mime="application/octet-stream")
+            d2.download_button("⬇️ Parquet (8760 h)", to_bytes(write_parquet, record_batches(hourly_columns(hourly, anual=True))),
+                               file_name="liquidacion_anual.parquet", mime="application/octet-stream")
+            d3.download_button("⬇️ Arrow (día típico)", to_bytes(write_arrow, record_batches(hourly_columns(hourly))),
+                               file_name="liquidacion_horaria.arrow", mime="application/vnd.apache.arrow.stream")
+
     # Sección de Gráficos
     with st.expander("Graficos Comportamiento Generacion Vs Consumo"):
         st.subheader("Análisis de Comportamiento")
@@ -505,6 +493,15 @@ def main():
 
     render_detailed_billing(bill, CU, C, precio_bolsa, hourly, consumo)
 
+    # Liquidación por periodos: estacionalidad de la irradiancia de la estación y del precio de bolsa
+    factor_generacion = seasonal_factors(estacion["irradiancia"]) if estacion else np.ones(12)
+    precio_bolsa_mensual = precio_bolsa * load_spot_price_profile()
+    with timed("libro_mensual"):
+        # El factor mensual escala la potencia DC y el inversor recorta cada mes por separado
+        energia = monthly_energy(hourly["demand"], fv["dc"].sum(axis=0), factor_generacion, limite_ac=fv["limite_ac"])
+        libro = monthly_ledger(energia, CU, C, precio_bolsa_mensual, factor_contribucion)
+    render_monthly_ledger(libro, bill, precio_bolsa_mensual)
+
     # -----------------------------------------------------------------------------
     # 4.1. IMPACTO AMBIENTAL Y SOSTENIBILIDAD
     # -----------------------------------------------------------------------------
@@ -512,15 +509,18 @@ def main():
     st.markdown("## 🍃 Impacto Ambiental y Sostenibilidad")
 
     # A. Constantes y Cálculos
-    factor_emision = 0.1643 # tCO2e / MWh (UPME/XM)
     factor_arboles = 50     # árboles / tCO2
     horizonte_amb = 25      # años
 
-    # Generación anual en MWh
-    gen_anual_mwh = (gen_obj * 12) / 1000 
+    # Generación anual en MWh: la AC entregada por el inversor (orientación y recorte incluidos)
+    gen_anual_mwh = hourly["generation"].sum() * 30 * 12 / 1000
     
-    # Impactos
-    co2_anual = gen_anual_mwh * factor_emision
+    # Impactos: la energía solar desplaza la de la red en la hora en que se genera
+    # (autoconsumo + excedente = generación), con el factor marginal de ese mes y hora
+    factores_emision = load_emission_factor_table()
+    co2_mensual = co2_avoided_monthly(hourly["generation"], factores_emision)
+    co2_anual = float(co2_mensual.sum())
+    factor_efectivo = co2_anual / gen_anual_mwh if gen_anual_mwh > 0 else FACTOR_EMISION_SIN
     co2_total_25 = co2_anual * horizonte_amb
     
     arboles_anual = co2_anual * factor_arboles
@@ -540,7 +540,7 @@ def main():
         "Toneladas CO₂ / Año", 
         f"{co2_anual:.2f} t", 
         delta="☁️",
-        help="Calculado usando el Factor de Emisión del SIN (UPME/XM) de 0.1643 tCO2e/MWh. Referencia: Res. UPME 135 de 2025."
+        help=f"Calculado hora a hora con factores de emisión marginal del SIN por mes y hora (factor efectivo {factor_efectivo:.4f} tCO2e/MWh; promedio del SIN {FACTOR_EMISION_SIN} tCO2e/MWh). Referencia: Res. UPME 135 de 2025."
     )
     
     col_amb2.metric(
@@ -558,8 +558,8 @@ def main():
     )
 
     # C. Gráfico de Proyección Ambiental
-    anios_amb = list(range(1, horizonte_amb + 1))
-    acumulado_co2 = [co2_anual * a for a in anios_amb]
+    anios_amb = np.arange(1, horizonte_amb + 1)
+    acumulado_co2 = co2_anual * anios_amb
 
     with st.expander("🍃 Ver Proyección de Impacto Ambiental"):
         fig_amb = go.Figure()
@@ -580,7 +580,7 @@ def main():
             plot_bgcolor='rgba(0,0,0,0)',
             hovermode="x unified"
         )
-        st.plotly_chart(fig_amb, use_container_width=True)
+        plotly_chart(fig_amb, "impacto_ambiental")
 
     st.caption("📜 *Marco Normativo: Ley 2169 de 2021 (Acción Climática) y Resolución UPME 135 de 2025.*")
 
@@ -810,7 +810,7 @@ def main():
             font=dict(size=12, color="#065F46")
         )
         
-        st.plotly_chart(fig_comp, use_container_width=True)
+        plotly_chart(fig_comp, "gasto_vpn")
     
     # E.2 Gráfica de Flujo de Caja Acumulado (Retorno) SECOND
     with st.expander("📈 Retorno de Inversión"):
@@ -836,8 +836,70 @@ def main():
             paper_bgcolor='rgba(0,0,0,0)',
             plot_bgcolor='rgba(0,0,0,0)',
         )
-        st.plotly_chart(fig_fin, use_container_width=True)
+        plotly_chart(fig_fin, "flujo_caja")
+
+    # -----------------------------------------------------------------------------
+    # 6. PORTAFOLIO DE CLIENTES
+    # -----------------------------------------------------------------------------
+    st.markdown("---")
+    st.markdown("## 📁 Portafolio de Clientes")
+    with st.expander("Cargar portafolio (CSV)"):
+        st.caption("Columnas: cliente, consumo_kwh, operador, nivel, estrato, mes (AAAA-MM) y, "
+                   "opcionalmente, porcentaje y hsp (o latitud y longitud para tomar la HSP de la estación más "
+                   "cercana). Si no se incluye el mes se usa la tarifa más reciente; "
+                   "sin porcentaje ni hsp se usan los valores del panel lateral.")
+        archivo = st.file_uploader("Archivo de clientes", type=["csv"])
+        if archivo is not None:
+            clientes = pd.read_csv(archivo, dtype={"estrato": str, "mes": str})
+            if "mes" not in clientes.columns and len(tabla_tarifas):
+                clientes["mes"] = tabla_tarifas.index.unique("mes").max()
+            faltantes = {"consumo_kwh", "operador", "nivel", "estrato", "mes"} - set(clientes.columns)
+            if faltantes:
+                st.error(f"Faltan columnas en el archivo: {', '.join(sorted(faltantes))}")
+            else:
+                portafolio = resolve_tariffs(clientes, tabla_tarifas)
+                if "hsp" not in portafolio and {"latitud", "longitud"} <= set(portafolio.columns) and estaciones is not None:
+                    # Una sola consulta vectorizada al índice para todos los clientes
+                    cercana, distancia = estaciones.nearest(portafolio["latitud"].to_numpy(dtype=float),
+                                                            portafolio["longitud"].to_numpy(dtype=float))
+                    con_coordenadas = cercana >= 0
+                    portafolio["estacion_hsp"] = np.where(con_coordenadas, np.asarray(estaciones.etiquetas, dtype=object)[cercana], None)
+                    portafolio["distancia_estacion_km"] = distancia
+                    portafolio["hsp"] = np.where(con_coordenadas, estaciones.hsp[cercana], hsp)
+                portafolio["costo_sin"] = portafolio["consumo_kwh"] * portafolio["cu"] * (1 + portafolio["factor_contribucion"] / 100)
+                sin_tarifa = int(portafolio["cu"].isna().sum())
+                if sin_tarifa:
+                    st.warning(f"{sin_tarifa} clientes sin tarifa en la tabla (revise operador, nivel, estrato y mes).")
+                st.metric("Costo Mensual Portafolio (Sin Proyecto)", f"$ {portafolio['costo_sin'].sum():,.0f} COP")
+                st.dataframe(portafolio, use_container_width=True)
+
+                # Simulación horaria de cada cliente en el pool de procesos: cada cambio de
+                # parámetros envía un trabajo nuevo que reemplaza al de esta sesión
+                if st.toggle("Simular portafolio (segundo plano)", key="simular_portafolio"):
+                    validos = portafolio.dropna(subset=TARIFF_COLUMNS).reset_index(drop=True)
+                    escenario = f"portafolio:{st.session_state.setdefault('id_sesion', uuid.uuid4().hex)}"
+                    # Estacionalidad de la generación por cliente según su estación más cercana
+                    factor_generacion = None
+                    if {"latitud", "longitud"} <= set(validos.columns) and estaciones is not None:
+                        cercana, _ = estaciones.nearest(validos["latitud"].to_numpy(dtype=float),
+                                                        validos["longitud"].to_numpy(dtype=float))
+                        factor_generacion = estaciones.seasonality(cercana)
+                    job_id = get_job_manager().submit(
+                        escenario, simulate_portfolio,
+                        validos["consumo_kwh"].to_numpy(dtype=float),
+                        validos["cu"].to_numpy(dtype=float),
+                        validos["c"].to_numpy(dtype=float),
+                        precio_bolsa,
+                        validos["factor_contribucion"].to_numpy(dtype=float),
+                        validos["porcentaje"].to_numpy(dtype=float) if "porcentaje" in validos else percent,
+                        validos["hsp"].to_numpy(dtype=float) if "hsp" in validos else hsp,
+                        factor_generacion_mensual=factor_generacion,
+                        factor_bolsa_mensual=load_spot_price_profile(),
+                    )
+                    render_portfolio_job(job_id, validos)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # Se mide desde la primera línea del script (incluye imports en el primer rerun)
+    with timed_rerun(_T_INICIO_SCRIPT):
+        main()
\ No newline at end of file
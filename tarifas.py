@@ -0,0 +1,48 @@
+"""
+Tarifas por operador de red, nivel de tensión, estrato / uso y mes.
+
+Lógica de datos pura (pandas, sin Streamlit): la app la envuelve en
+`st.cache_resource` para cargar la tabla una sola vez por proceso.
+"""
+import os
+
+import pandas as pd
+
+TARIFAS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "tarifas.csv")
+TARIFF_KEYS = ["operador", "nivel", "estrato", "mes"]
+TARIFF_COLUMNS = ["cu", "c", "factor_contribucion"]
+
+
+def load_tariffs(path: str = TARIFAS_PATH):
+    """Carga la tabla de tarifas (operador x nivel x estrato x mes).
+
+    Devuelve `(indice, tabla)`: `indice` es un dict (operador, nivel, estrato, mes) ->
+    (CU, C, contribución) para consultas O(1) desde el sidebar, y `tabla` el mismo
+    contenido con MultiIndex para resolver portafolios con un join vectorizado.
+    Ambos son compartidos entre sesiones y se tratan como solo lectura.
+    """
+    if not os.path.exists(path):
+        tabla = pd.DataFrame(columns=TARIFF_KEYS + TARIFF_COLUMNS).set_index(TARIFF_KEYS)
+        return {}, tabla
+    tabla = pd.read_csv(path, dtype={"operador": str, "nivel": int, "estrato": str, "mes": str})
+    tabla = tabla.set_index(TARIFF_KEYS).sort_index()
+    indice = dict(zip(tabla.index, tabla[TARIFF_COLUMNS].itertuples(index=False, name=None)))
+    return indice, tabla
+
+
+def resolve_tariffs(clientes: pd.DataFrame, tabla: pd.DataFrame) -> pd.DataFrame:
+    """Asigna CU, C y contribución a cada cliente con un join vectorizado sobre la tabla.
+
+    `clientes` debe tener las columnas operador, nivel, estrato y mes. Los clientes
+    sin tarifa en la tabla, o con un nivel vacío o no entero, quedan con NaN.
+    """
+    nivel = pd.to_numeric(clientes["nivel"], errors="coerce")
+    nivel = nivel.where(nivel == nivel.round()).astype("Int64")
+    claves = pd.MultiIndex.from_arrays([
+        clientes["operador"].astype(str).to_numpy(),
+        nivel.to_numpy(),
+        clientes["estrato"].astype(str).to_numpy(),
+        clientes["mes"].astype(str).to_numpy(),
+    ], names=TARIFF_KEYS)
+    tarifas = tabla.reindex(claves)
+    return clientes.assign(**{col: tarifas[col].to_numpy() for col in TARIFF_COLUMNS})
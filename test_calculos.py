@@ -0,0 +1,151 @@
+import numpy as np
+
+from calculos import (
+    FACTOR_EMISION_SIN, billing, co2_avoided_monthly, hourly_consumption_profile, load_emission_factors,
+    monthly_energy, monthly_ledger, multi_array_generation_profile, settle_hourly, simulate_portfolio,
+    solar_generation_profile,
+)
+
+
+class _SinProgreso:
+    def update(self, fraccion):
+        pass
+
+
+def test_billing_por_lotes_coincide_con_cliente_individual():
+    consumo = np.array([300.0, 1200.0, 8000.0])
+    percent = np.array([50.0, 100.0, 180.0])
+    demand = hourly_consumption_profile(consumo)
+    generation = solar_generation_profile(consumo, percent)
+    lote = billing(consumo, settle_hourly(demand, generation), 720.0, 56.71, 210.0, 20.0)
+
+    for i in range(len(consumo)):
+        uno = billing(consumo[i], settle_hourly(demand[i], generation[i]), 720.0, 56.71, 210.0, 20.0)
+        for clave, valor in uno.items():
+            assert np.isclose(lote[clave][i], valor), clave
+
+
+def test_simulate_portfolio_ahorro_igual_a_diferencia_de_facturas():
+    consumo = np.linspace(200.0, 5000.0, 50)
+    r = simulate_portfolio(_SinProgreso(), consumo, 800.0, 60.0, 210.0, 20.0, 100.0, 4.0, bloque=7)
+    assert r["demand"].shape == (50, 24)
+    assert np.allclose(r["demand"].sum(axis=1) * 30, consumo)
+    assert np.allclose(r["ahorro"], r["costo_sin"] - r["costo_con"])
+    assert np.allclose(r["kwp"], consumo / (30 * 4.0))
+
+
+def test_libro_mensual_sin_estacionalidad_repite_el_mes_tipico():
+    demand = hourly_consumption_profile(1200.0)
+    generation = solar_generation_profile(1200.0, 150.0)
+    bill = billing(1200.0, settle_hourly(demand, generation), 720.0, 56.71, 210.0, 20.0)
+    libro = monthly_ledger(monthly_energy(demand, generation, np.ones(12)), 720.0, 56.71, np.full(12, 210.0), 20.0)
+    for clave in ("exc_tipo1", "exc_tipo2", "costo_sin", "costo_con", "v_contribucion", "v_intercambio"):
+        assert libro[clave].shape == (12,)
+        assert np.allclose(libro[clave], bill[clave]), clave
+    assert np.isclose(libro["ahorro_anual"], 12 * (bill["costo_sin"] - bill["costo_con"]))
+
+
+def test_libro_mensual_de_portafolio_coincide_con_cada_cliente():
+    consumo = np.array([400.0, 1500.0, 9000.0])
+    demand = hourly_consumption_profile(consumo)
+    generation = solar_generation_profile(consumo, np.array([80.0, 120.0, 200.0]))
+    factores = np.linspace(0.8, 1.2, 36).reshape(3, 12)
+    precios = np.linspace(150.0, 350.0, 12)
+    CU = np.array([700.0, 750.0, 800.0])
+    lote = monthly_ledger(monthly_energy(demand, generation, factores), CU[:, None], 60.0, precios, 20.0)
+    assert lote["costo_con"].shape == (3, 12)
+    for i in range(3):
+        uno = monthly_ledger(monthly_energy(demand[i], generation[i], factores[i]), CU[i], 60.0, precios, 20.0)
+        for clave in ("exc_tipo1", "exc_tipo2", "costo_con", "ahorro"):
+            assert np.allclose(lote[clave][i], uno[clave]), clave
+
+    # Un mes con más sol mueve excedentes de Tipo 1 a Tipo 2
+    assert lote["exc_tipo2"][2, -1] > lote["exc_tipo2"][2, 0]
+
+
+def test_simulate_portfolio_liquida_doce_periodos_por_cliente():
+    consumo = np.linspace(200.0, 5000.0, 10)
+    r = simulate_portfolio(_SinProgreso(), consumo, 800.0, 60.0, 210.0, 20.0, 150.0, 4.0, bloque=4,
+                           factor_generacion_mensual=np.linspace(0.9, 1.1, 12), factor_bolsa_mensual=np.ones(12))
+    assert r["exc_tipo2_periodos"].shape == (10, 12)
+    assert np.allclose(r["ahorro_anual"], r["ahorro_periodos"].sum(axis=1))
+
+
+def test_arreglo_horizontal_reproduce_el_perfil_solar():
+    consumo, percent, hsp = 1200.0, 100.0, 4.0
+    kwp = consumo * percent / 100 / (30 * hsp)
+    fv = multi_array_generation_profile(kwp, hsp, np.array([1.0]), np.array([180.0]), np.array([0.0]), 0.5)
+    assert np.allclose(fv["ac"], solar_generation_profile(consumo, percent))
+    assert np.allclose(fv["recorte"], 0.0)
+
+
+def test_recorte_del_inversor_hora_a_hora():
+    fv = multi_array_generation_profile(10.0, 5.0, np.array([1.0]), np.array([180.0]), np.array([0.0]), 2.0)
+    limite = 10.0 / 2.0
+    dc_total = fv["dc"].sum(axis=0)
+    assert fv["ac"].max() <= limite + 1e-12
+    assert np.allclose(fv["ac"], np.minimum(dc_total, limite))
+    assert np.allclose(fv["recorte"], dc_total - fv["ac"])
+    assert fv["recorte"].sum() > 0
+
+
+def test_orientaciones_mixtas_desplazan_la_generacion():
+    args = (10.0, 4.0)
+    oriente = multi_array_generation_profile(*args, np.array([1.0]), np.array([90.0]), np.array([30.0]), 0.5)
+    occidente = multi_array_generation_profile(*args, np.array([1.0]), np.array([270.0]), np.array([30.0]), 0.5)
+    mixto = multi_array_generation_profile(*args, np.array([1.0, 1.0]), np.array([90.0, 270.0]),
+                                           np.array([30.0, 30.0]), 0.5)
+    # Oriente genera más en la mañana, occidente en la tarde; el mixto reparte el kWp
+    assert oriente["ac"][:12].sum() > oriente["ac"][12:].sum()
+    assert occidente["ac"][12:].sum() > occidente["ac"][:12].sum()
+    assert mixto["dc"].shape == (2, 24)
+    assert np.allclose(mixto["dc"][0], oriente["dc"][0] / 2)
+    assert np.allclose(mixto["dc"][1], occidente["dc"][0] / 2)
+    assert np.allclose(mixto["ac"], mixto["dc"].sum(axis=0))
+
+
+def test_libro_mensual_recorta_cada_mes_al_inversor():
+    consumo = 900.0
+    demand = hourly_consumption_profile(consumo)
+    fv = multi_array_generation_profile(10.0, 5.0, np.array([1.0]), np.array([180.0]), np.array([0.0]), 1.6)
+    dc = fv["dc"].sum(axis=0)
+    factores = np.linspace(0.7, 1.3, 12)
+    precios = np.linspace(150.0, 350.0, 12)
+    libro = monthly_ledger(monthly_energy(demand, dc, factores, limite_ac=fv["limite_ac"]), 720.0, 56.71, precios, 20.0)
+
+    for m in range(12):
+        ac = np.minimum(dc * factores[m], fv["limite_ac"])
+        bill = billing(consumo, settle_hourly(demand, ac), 720.0, 56.71, precios[m], 20.0)
+        assert np.isclose(libro["generacion_mes"][m], ac.sum() * 30)
+        for clave in ("exc_tipo1", "exc_tipo2", "costo_con"):
+            assert np.isclose(libro[clave][m], bill[clave]), (clave, m)
+
+    # Recortar antes de aplicar el factor sobrestima la generación de los meses soleados
+    assert libro["generacion_mes"][-1] < fv["ac"].sum() * factores[-1] * 30
+
+
+def test_factores_de_emision_horarios_mensuales_y_por_defecto(tmp_path):
+    horaria = tmp_path / "horaria.csv"
+    horaria.write_text("mes,hora,factor_tco2_mwh\n1,0,0.2\n1,12,0.1\n12,23,\n")
+    factores = load_emission_factors(str(horaria))
+    assert factores.shape == (12, 24)
+    assert factores[0, 0] == 0.2 and factores[0, 12] == 0.1
+    # Celdas vacías o ausentes: promedio del SIN
+    assert factores[11, 23] == FACTOR_EMISION_SIN and factores[5, 5] == FACTOR_EMISION_SIN
+
+    mensual = tmp_path / "mensual.csv"
+    mensual.write_text("mes,factor_tco2_mwh\n3,0.3\n")
+    factores = load_emission_factors(str(mensual))
+    assert np.all(factores[2] == 0.3)
+    assert np.all(np.delete(factores, 2, axis=0) == FACTOR_EMISION_SIN)
+
+    assert np.all(load_emission_factors(str(tmp_path / "no_existe.csv")) == FACTOR_EMISION_SIN)
+
+
+def test_co2_evitado_con_factor_plano_es_energia_por_factor():
+    generation = solar_generation_profile(1200.0, 100.0)
+    co2 = co2_avoided_monthly(generation, np.full((12, 24), FACTOR_EMISION_SIN))
+    assert co2.shape == (12,)
+    assert np.allclose(co2, generation.sum() * 30 / 1000 * FACTOR_EMISION_SIN)
+    # La tabla del repositorio es horaria y completa
+    assert not np.all(load_emission_factors() == FACTOR_EMISION_SIN)
@@ -0,0 +1,47 @@
+import numpy as np
+
+from estaciones import StationIndex, load_stations
+
+
+def test_indice_coincide_con_fuerza_bruta():
+    rng = np.random.default_rng(7)
+    lat = rng.uniform(0.0, 10.0, 50)
+    lon = rng.uniform(-78.0, -68.0, 50)
+    indice = StationIndex([f"E{i}" for i in range(50)], ["D"] * 50, lat, lon, np.full(50, 4.0), np.full((50, 12), 4.0))
+
+    # Puntos dentro de la malla, fuera de ella y sin coordenadas
+    q_lat = np.concatenate([rng.uniform(-1.0, 11.0, 5000), [30.0, -20.0, np.nan]])
+    q_lon = np.concatenate([rng.uniform(-79.0, -67.0, 5000), [-74.0, -60.0, -74.0]])
+    cercana, distancia = indice.nearest(q_lat, q_lon)
+
+    d = np.hypot((q_lon[:, None] - lon) * np.cos(np.radians(4.6)), q_lat[:, None] - lat)
+    assert np.array_equal(cercana[:-1], d[:-1].argmin(axis=1))
+    assert np.allclose(distancia[:-1], d[:-1].min(axis=1) * 111.2)
+    assert cercana[-1] == -1 and np.isnan(distancia[-1])
+
+
+def test_consulta_por_municipio_y_por_coordenadas():
+    estaciones = load_stations()
+    bogota = estaciones.by_label("Bogotá D.C.")
+    assert bogota["irradiancia"].shape == (12,)
+    assert np.isclose(bogota["irradiancia"].mean(), bogota["hsp"], atol=0.01)
+
+    cercana = estaciones.lookup(bogota["latitud"] + 0.01, bogota["longitud"])
+    assert cercana["etiqueta"] == "Bogotá D.C."
+    assert 0.0 < cercana["distancia_km"] < 2.0
+
+
+def test_indice_con_mas_estaciones_que_int16():
+    n = 40_000
+    rng = np.random.default_rng(11)
+    lat = rng.uniform(4.0, 4.5, n)
+    lon = rng.uniform(-74.5, -74.0, n)
+    indice = StationIndex([f"E{i}" for i in range(n)], ["D"] * n, lat, lon, np.full(n, 4.0), np.full((n, 12), 4.0), celda=0.1)
+
+    q_lat = rng.uniform(3.9, 4.6, 300)
+    q_lon = rng.uniform(-74.6, -73.9, 300)
+    cercana, _ = indice.nearest(q_lat, q_lon)
+
+    d = np.hypot((q_lon[:, None] - lon) * np.cos(np.radians(4.6)), q_lat[:, None] - lat)
+    assert np.array_equal(cercana, d.argmin(axis=1))
+    assert cercana.max() > np.iinfo(np.int16).max
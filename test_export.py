@@ -0,0 +1,36 @@
+import io
+
+import numpy as np
+import pyarrow.parquet as pq
+
+from export import SETTLEMENT_KEYS, annual_record_batches, hourly_columns, record_batches, to_bytes, write_parquet
+
+
+def _horario(n):
+    rng = np.random.default_rng(0)
+    return {k: rng.uniform(0, 5, (n, 24)) for k in SETTLEMENT_KEYS}
+
+
+def test_lotes_son_vistas_sin_copia_de_los_arreglos():
+    horario = _horario(10)
+    lotes = list(record_batches(horario, filas_por_lote=4))
+    assert [b.num_rows for b in lotes] == [4, 4, 2]
+    valores = lotes[1].column("demand").values
+    assert valores.buffers()[1].address == horario["demand"][4:8].ctypes.data
+
+
+def test_parquet_anual_repite_el_dia_tipico():
+    horario = _horario(3)
+    datos = to_bytes(write_parquet, annual_record_batches(horario, {"cliente": np.arange(3)}, filas_por_lote=2))
+    tabla = pq.read_table(io.BytesIO(datos))
+    assert tabla.num_rows == 3
+    anual = np.asarray(tabla.column("excedente")[2].as_py())
+    assert anual.shape == (8760,)
+    assert np.allclose(anual.reshape(365, 24), horario["excedente"][2])
+
+
+def test_columnas_de_un_cliente():
+    hourly = {k: v[0] for k, v in _horario(1).items()}
+    tabla = pq.read_table(io.BytesIO(to_bytes(write_parquet, record_batches(hourly_columns(hourly)))))
+    assert tabla.num_rows == 24
+    assert np.allclose(tabla.column("importada").to_numpy(), hourly["importada"])
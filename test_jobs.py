@@ -0,0 +1,138 @@
+import os
+import signal
+import threading
+import time
+
+import numpy as np
+
+from calculos import simulate_portfolio
+from jobs import JobManager
+
+
+def _esperar(manager, job_id, timeout=60.0):
+    limite = time.monotonic() + timeout
+    while manager.status(job_id)["estado"] in ("pendiente", "ejecutando"):
+        assert time.monotonic() < limite, "el trabajo no terminó a tiempo"
+        time.sleep(0.05)
+    return manager.status(job_id)
+
+
+def test_trabajo_nuevo_reemplaza_al_anterior_y_resultado_llega_por_memoria_compartida():
+    manager = JobManager(max_workers=1, max_results=2)
+    try:
+        consumo = np.random.uniform(300, 5000, 1_000_000)
+        lento = manager.submit("sesion", simulate_portfolio, consumo, 800.0, 60.0, 210.0, 20.0, 100.0, 4.0, bloque=5_000)
+        rapido = manager.submit("sesion", simulate_portfolio, consumo[:2_000], 800.0, 60.0, 210.0, 20.0, 100.0, 4.0)
+
+        estado = _esperar(manager, rapido)
+        assert estado["estado"] == "terminado"
+        assert _esperar(manager, lento)["estado"] == "cancelado"
+
+        demand = estado["resultado"]["demand"]
+        assert demand.shape == (2_000, 24)
+        assert not demand.flags.owndata  # vista sobre el bloque compartido, sin copia
+        assert np.allclose(demand.sum(axis=1) * 30, consumo[:2_000])
+
+        # Mismo trabajo en otro escenario: se sirve desde la caché
+        assert manager.submit("otra", simulate_portfolio, consumo[:2_000], 800.0, 60.0, 210.0, 20.0, 100.0, 4.0) == rapido
+        assert manager.status(rapido)["estado"] == "terminado"
+    finally:
+        manager.shutdown()
+
+
+def test_error_en_el_trabajo_se_reporta_en_el_estado():
+    manager = JobManager(max_workers=1)
+    try:
+        job_id = manager.submit("sesion", simulate_portfolio, "no es un arreglo", 1, 1, 1, 1, 1, 1)
+        estado = _esperar(manager, job_id)
+        assert estado["estado"] == "error"
+        assert "ValueError" in estado["error"]
+
+        # Volver a enviarlo (cada rerun de la app) no lo relanza: el error se mantiene
+        assert manager.submit("sesion", simulate_portfolio, "no es un arreglo", 1, 1, 1, 1, 1, 1) == job_id
+        assert manager.status(job_id)["estado"] == "error"
+    finally:
+        manager.shutdown()
+
+
+def test_trabajo_cancelado_no_se_relanza_en_su_escenario():
+    manager = JobManager(max_workers=1)
+    try:
+        args = (np.random.uniform(300, 5000, 1_000_000), 800.0, 60.0, 210.0, 20.0, 100.0, 4.0)
+        job_id = manager.submit("sesion", simulate_portfolio, *args, bloque=5_000)
+        manager.cancel("sesion")
+        assert _esperar(manager, job_id)["estado"] == "cancelado"
+        assert manager.submit("sesion", simulate_portfolio, *args, bloque=5_000) == job_id
+        assert manager.status(job_id)["estado"] == "cancelado"
+
+        # Otro escenario con los mismos argumentos sí lo ejecuta
+        manager.submit("otra", simulate_portfolio, *args, bloque=5_000)
+        assert manager.status(job_id)["estado"] in ("pendiente", "ejecutando")
+    finally:
+        manager.shutdown()
+
+
+def test_pool_roto_se_reconstruye_y_el_trabajo_queda_con_error():
+    manager = JobManager(max_workers=1)
+    try:
+        consumo = np.random.uniform(300, 5000, 1_000_000)
+        job_id = manager.submit("a", simulate_portfolio, consumo, 800.0, 60.0, 210.0, 20.0, 100.0, 4.0, bloque=5_000)
+        limite = time.monotonic() + 60.0
+        while manager.status(job_id)["progreso"] == 0.0:
+            assert time.monotonic() < limite, "el trabajo no empezó a tiempo"
+            time.sleep(0.05)
+        for proceso in list(manager._pool._processes.values()):
+            os.kill(proceso.pid, signal.SIGKILL)
+
+        estado = _esperar(manager, job_id)
+        assert estado["estado"] == "error"
+        assert "BrokenProcessPool" in estado["error"]
+
+        nuevo = manager.submit("b", simulate_portfolio, consumo[:2_000], 800.0, 60.0, 210.0, 20.0, 100.0, 4.0)
+        assert _esperar(manager, nuevo)["estado"] == "terminado"
+    finally:
+        manager.shutdown()
+
+
+def test_reemplazar_un_trabajo_pendiente_no_bloquea_al_administrador():
+    manager = JobManager(max_workers=1)
+    try:
+        consumo = np.random.uniform(300, 5000, 1_000_000)
+        # El pool pasa a su cola interna (ya "en ejecución") hasta max_workers + 1 trabajos
+        ocupados = [manager.submit(e, simulate_portfolio, consumo, 800.0 + i, 60.0, 210.0, 20.0, 100.0, 4.0, bloque=5_000)
+                    for i, e in enumerate("abc")]
+        pendiente = manager.submit("x", simulate_portfolio, consumo[:100], 800.0, 60.0, 210.0, 20.0, 100.0, 4.0)
+        assert manager.status(pendiente)["estado"] == "pendiente"
+
+        # Cancelar un future pendiente ejecuta el callback en el mismo hilo
+        enviado = []
+        hilo = threading.Thread(target=lambda: enviado.append(
+            manager.submit("x", simulate_portfolio, consumo[:200], 800.0, 60.0, 210.0, 20.0, 100.0, 4.0)))
+        hilo.start()
+        hilo.join(timeout=10.0)
+        assert not hilo.is_alive(), "submit quedó bloqueado al reemplazar un trabajo pendiente"
+
+        assert manager.status(pendiente)["estado"] == "cancelado"
+        for e, ocupado in zip("abc", ocupados):
+            manager.cancel(e)
+        for ocupado in ocupados:
+            assert _esperar(manager, ocupado)["estado"] == "cancelado"
+        assert _esperar(manager, enviado[0])["estado"] == "terminado"
+    finally:
+        manager.shutdown()
+
+
+def test_cache_de_resultados_acotada_por_bytes():
+    manager = JobManager(max_workers=1, max_results=16, max_result_bytes=3 * 2_000 * 24 * 8 * 5)
+    try:
+        consumo = np.random.uniform(300, 5000, 2_000)
+        ids = [manager.submit(f"s{i}", simulate_portfolio, consumo, 800.0 + i, 60.0, 210.0, 20.0, 100.0, 4.0)
+               for i in range(4)]
+        for job_id in ids:
+            _esperar(manager, job_id)
+        # Cada resultado ocupa algo más de 5 arreglos N x 24: caben dos, no cuatro
+        terminados = [manager.status(j)["estado"] == "terminado" for j in ids]
+        assert terminados[-1] and sum(terminados) < len(ids)
+        assert manager._result_bytes <= 3 * 2_000 * 24 * 8 * 5
+    finally:
+        manager.shutdown()
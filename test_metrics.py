@@ -0,0 +1,40 @@
+import time
+
+import metrics
+from metrics import REGISTRY, Registry, process_start_time, timed_rerun
+
+
+def test_formato_prometheus_de_contadores_e_histogramas():
+    registry = Registry()
+    registry.counter("agpe_reruns_total", "Reruns del script").inc(3)
+    hist = registry.histogram("agpe_stage_seconds", "Tiempo por etapa", buckets=(0.01, 0.1), stage="liquidacion")
+    for valor in (0.005, 0.05, 0.5):
+        hist.observe(valor)
+
+    texto = registry.render_prometheus()
+    assert "# TYPE agpe_reruns_total counter" in texto
+    assert "agpe_reruns_total 3" in texto
+    assert 'agpe_stage_seconds_bucket{stage="liquidacion",le="0.01"} 1' in texto
+    assert 'agpe_stage_seconds_bucket{stage="liquidacion",le="0.1"} 2' in texto
+    assert 'agpe_stage_seconds_bucket{stage="liquidacion",le="+Inf"} 3' in texto
+    assert 'agpe_stage_seconds_count{stage="liquidacion"} 3' in texto
+
+
+def test_misma_metrica_y_etiquetas_devuelve_la_misma_instancia():
+    registry = Registry()
+    assert registry.counter("c", cache="a") is registry.counter("c", cache="a")
+    assert registry.counter("c", cache="a") is not registry.counter("c", cache="b")
+
+
+def test_primer_rerun_registra_arranque_en_frio():
+    metrics._first_rerun_done = False
+    with timed_rerun(time.perf_counter() - 0.5):
+        pass
+    primero = REGISTRY.gauge("agpe_first_rerun_seconds").value
+    assert primero >= 0.5
+    assert REGISTRY.gauge("agpe_cold_start_seconds").value >= 0.0
+    assert process_start_time() <= time.time()
+
+    with timed_rerun():
+        pass
+    assert REGISTRY.gauge("agpe_first_rerun_seconds").value == primero
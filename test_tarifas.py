@@ -0,0 +1,36 @@
+import numpy as np
+import pandas as pd
+
+from tarifas import TARIFF_COLUMNS, load_tariffs, resolve_tariffs
+
+
+def test_join_vectorizado_coincide_con_el_indice_por_fila():
+    indice, tabla = load_tariffs()
+    rng = np.random.default_rng(3)
+    claves = [list(indice)[i] for i in rng.choice(len(indice), 200)]
+    clientes = pd.DataFrame(claves, columns=["operador", "nivel", "estrato", "mes"])
+    # Claves que no existen en la tabla
+    clientes.loc[len(clientes)] = ["Operador Inexistente", 1, "5", "2025-06"]
+    clientes.loc[len(clientes)] = [claves[0][0], 9, claves[0][2], claves[0][3]]
+
+    resuelto = resolve_tariffs(clientes, tabla)
+    for fila, clave in zip(resuelto.itertuples(index=False), clientes.itertuples(index=False, name=None)):
+        esperado = indice.get(clave)
+        obtenido = tuple(getattr(fila, col) for col in TARIFF_COLUMNS)
+        if esperado is None:
+            assert all(np.isnan(obtenido))
+        else:
+            assert np.allclose(obtenido, esperado)
+
+
+def test_nivel_vacio_o_invalido_queda_sin_tarifa():
+    indice, tabla = load_tariffs()
+    operador, nivel, estrato, mes = next(iter(indice))
+    clientes = pd.DataFrame({
+        "operador": [operador] * 4,
+        "nivel": [np.nan, "x", "1.5", str(nivel)],
+        "estrato": [estrato] * 4,
+        "mes": [mes] * 4,
+    })
+    resuelto = resolve_tariffs(clientes, tabla)
+    assert resuelto["cu"].isna().tolist() == [True, True, True, False]